@@ -43,6 +43,14 @@ class Changeset(object):
     add=__iadd__
     extend=__iadd__
 
+    def ordered(self):
+        # group the changes into buckets by priority and concatenate them,
+        # changes with the same priority keep the order they were added in
+        buckets = {}
+        for change in self.changes:
+            buckets.setdefault(change.priority, []).append(change)
+        return [change for priority in sorted(buckets) for change in buckets[priority]]
+
 class Config(object):
     _instance = None
     def __new__(cls, *args, **kwargs):
@@ -73,7 +81,9 @@ class Config(object):
 def main():
     import argparse
     import psycopg2
-    from pypgdiff.objects import Database, Schema
+    import sys
+    from pypgdiff.objects import Database, Schema, diff_schemas
+    from pypgdiff.changes import rendered
 
     p = argparse.ArgumentParser()
     p.add_argument("--host", type=str, help="Host for BOTH schemas")
@@ -88,28 +98,129 @@ def main():
     p.add_argument("--db2", type=str, help="Database for target schema")
     p.add_argument("--user2", type=str, help="Username for target schema")
     p.add_argument("--pass2", type=str, help="Password for target schema")
+    p.add_argument("--snapshot1", type=str, help="Snapshot file to use as the source schema")
+    p.add_argument("--snapshot2", type=str, help="Snapshot file to use as the target schema")
+    p.add_argument("--cache-dir", type=str, help="Directory to cache introspection results in between runs")
+    p.add_argument("--pattern", type=str, help="Compare every schema matching this regex with the same schema on the target")
+    p.add_argument("--golden", type=str, help="With --pattern, compare this source schema against every matching target schema")
+    p.add_argument("--jobs", type=int, help="Number of worker processes for --golden (defaults to one per CPU), or connections for --apply (defaults to 1)")
+    p.add_argument("--apply", action="store_true", help="Apply the changes to the target schema instead of printing them")
+    p.add_argument("--online", action="store_true", help="Build indexes and constraints without blocking writes where possible")
+    p.add_argument("--analyze", action="store_true", help="Annotate each change with its locks, table size and estimated duration")
     p.add_argument("--normalize-constraints", action="store_true", help="Use normalized names when comparing constraints")
     p.add_argument("--prompt", action="store_true", help="Prompt for default values")
-    p.add_argument("schemas", type=str, nargs=2, help="Schemas to compare")
+    p.add_argument("schemas", type=str, nargs="*", help="Schemas to compare")
 
     args = p.parse_args()
 
-    db1 = psycopg2.connect(
-        database = args.db1 or args.db,
-        user = args.user1 or args.user,
-        password = args.pass1 or getattr(args, 'pass'),
-        host = args.host1 or args.host)
-    s1 = Schema(database=Database(conn=db1), name=args.schemas[0])
-
-    db2 = psycopg2.connect(
-        database = args.db2 or args.db,
-        user = args.user2 or args.user,
-        password = args.pass2 or getattr(args, 'pass'),
-        host = args.host2 or args.host)
-    s2 = Schema(database=Database(conn=db2), name=args.schemas[1])
-
-    with Config(normalize_constraints=args.normalize_constraints, prompt_for_defaults=args.prompt):
-        cs = s1 | s2
-
-    for c in cs:
-        print("%s\n" % c.sql)
+    def connect1():
+        return psycopg2.connect(
+            database = args.db1 or args.db,
+            user = args.user1 or args.user,
+            password = args.pass1 or getattr(args, 'pass'),
+            host = args.host1 or args.host)
+
+    def connect2_kwargs():
+        return dict(
+            database = args.db2 or args.db,
+            user = args.user2 or args.user,
+            password = args.pass2 or getattr(args, 'pass'),
+            host = args.host2 or args.host)
+
+    def connect2():
+        return psycopg2.connect(**connect2_kwargs())
+
+    if args.golden:
+        from pypgdiff.fanout import fanout_diff
+        if not args.pattern or args.schemas or args.snapshot2 or args.apply:
+            p.error("--golden needs --pattern and takes no schemas")
+        with Config(normalize_constraints=args.normalize_constraints):
+            if args.snapshot1:
+                golden = Schema.load(args.snapshot1)
+            else:
+                golden = Schema(database=Database(conn=connect1()), name=args.golden, cache_dir=args.cache_dir)
+            golden.introspect()
+        db2 = Database(conn=connect2())
+        names = db2.get_schemas(args.pattern)
+        if not args.snapshot1 and (args.db1, args.host1) == (args.db2, args.host2):
+            # the golden schema lives next to its tenants, don't compare it to itself
+            names = [name for name in names if name != args.golden]
+        db2.conn.close()
+        failed = 0
+        for name, sql, error in fanout_diff(golden, names, connect2_kwargs(), processes=args.jobs, normalize_constraints=args.normalize_constraints, online=args.online):
+            if error:
+                failed += 1
+                sys.stderr.write("Failed to compare schema %s:\n%s\n" % (name, error))
+                continue
+            print("-- %s -> %s\n" % (args.golden, name))
+            for statement in sql:
+                print("%s\n" % statement)
+            sys.stdout.flush()
+        if failed:
+            sys.exit(1)
+        return
+
+    if args.pattern:
+        if args.schemas or args.snapshot1 or args.snapshot2 or args.apply:
+            p.error("--pattern compares live databases and takes no schemas or snapshots")
+        db1 = Database(conn=connect1())
+        db2 = Database(conn=connect2())
+        names1 = set(db1.get_schemas(args.pattern))
+        names2 = set(db2.get_schemas(args.pattern))
+        for name in sorted(names1 ^ names2):
+            sys.stderr.write("Skipping schema %s, it only exists on one side\n" % name)
+        pairs = [(name, name) for name in sorted(names1 & names2)]
+        with Config(normalize_constraints=args.normalize_constraints, prompt_for_defaults=args.prompt, online=args.online):
+            for name1, name2, cs in diff_schemas(db1, db2, pairs):
+                print("-- %s -> %s\n" % (name1, name2))
+                for c in cs:
+                    for sql in rendered(c):
+                        print("%s\n" % sql)
+        return
+
+    if len(args.schemas) != 2:
+        p.error("expected a source and a target schema")
+
+    with Config(normalize_constraints=args.normalize_constraints):
+        if args.snapshot1:
+            s1 = Schema.load(args.snapshot1)
+        else:
+            s1 = Schema(database=Database(conn=connect1()), name=args.schemas[0], cache_dir=args.cache_dir)
+
+        if args.snapshot2:
+            s2 = Schema.load(args.snapshot2)
+        else:
+            s2 = Schema(database=Database(conn=connect2()), name=args.schemas[1], cache_dir=args.cache_dir)
+
+    if args.apply:
+        from pypgdiff.apply import apply_changes, summarize
+        if args.snapshot2:
+            p.error("--apply needs a live target schema")
+        def report(result):
+            print("%s\n-- %s\n" % (result.sql, result.status))
+            sys.stdout.flush()
+        with Config(normalize_constraints=args.normalize_constraints, prompt_for_defaults=args.prompt, online=args.online):
+            results = apply_changes(s1 | s2, connect2, jobs=args.jobs or 1, callback=report)
+        sys.stderr.write(summarize(results) + "\n")
+        if [r for r in results if not r.ok]:
+            sys.exit(1)
+        return
+
+    if args.analyze:
+        from pypgdiff.analysis import analyze, summarize
+        if args.snapshot2:
+            p.error("--analyze needs a live target schema")
+        with Config(normalize_constraints=args.normalize_constraints, prompt_for_defaults=args.prompt, online=args.online):
+            impacts = analyze(s1 | s2)
+            for impact in impacts:
+                print("-- %s" % impact)
+                for sql in rendered(impact.change):
+                    print("%s\n" % sql)
+        print("-- %s" % summarize(impacts))
+        return
+
+    with Config(normalize_constraints=args.normalize_constraints, prompt_for_defaults=args.prompt, online=args.online):
+        for c in s1.iter_changes(s2):
+            for sql in rendered(c):
+                print("%s\n" % sql)
+            sys.stdout.flush()
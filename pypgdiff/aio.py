@@ -0,0 +1,218 @@
+from pypgdiff.objects import BaseDatabase, Pending, PrefetchedDatabase, Schema
+
+# an asyncio backend for introspection, on psycopg2's asynchronous connections.
+# AsyncDatabase implements BaseDatabase (execute, fetchall, stream, mogrify,
+# server_version), blocking on its first connection, so every Schema method
+# keeps working on top of it.  introspect() on the other hand returns an
+# asyncio future: the bulk catalog queries for sequences, tables, columns,
+# constraints and indexes go out at the same time over a pool of connections,
+# and the event loop carries on while they run.  only plain callbacks and
+# futures are used here, so the trollius backport does on python 2
+
+def get_asyncio():
+    # asyncio where there is one, its trollius backport on python 2
+    try:
+        import asyncio
+    except ImportError:
+        import trollius as asyncio
+    return asyncio
+
+def wait(conn):
+    # block until an asynchronous connection is done with what it was doing
+    import select
+    from psycopg2.extensions import POLL_OK, POLL_READ, POLL_WRITE
+    while True:
+        state = conn.poll()
+        if state == POLL_OK:
+            return
+        elif state == POLL_READ:
+            select.select([conn.fileno()], [], [])
+        elif state == POLL_WRITE:
+            select.select([], [conn.fileno()], [])
+        else:
+            raise Exception("Unexpected poll state: %s" % state)
+
+def poll(loop, conn):
+    # the same, as a future resolved from the event loop
+    from psycopg2.extensions import POLL_OK, POLL_READ, POLL_WRITE
+    future = get_asyncio().Future(loop=loop)
+    fd = conn.fileno()
+    def step():
+        loop.remove_reader(fd)
+        loop.remove_writer(fd)
+        try:
+            state = conn.poll()
+        except Exception as e:
+            future.set_exception(e)
+            return
+        if state == POLL_OK:
+            future.set_result(None)
+        elif state == POLL_READ:
+            loop.add_reader(fd, step)
+        elif state == POLL_WRITE:
+            loop.add_writer(fd, step)
+        else:
+            future.set_exception(Exception("Unexpected poll state: %s" % state))
+    step()
+    return future
+
+class AsyncDatabase(BaseDatabase):
+    def __init__(self, connections=1, **connect_kwargs):
+        import collections, psycopg2
+        # every connection runs one query at a time, queries wait their turn
+        self.conns = [psycopg2.connect(async_=True, **connect_kwargs) for i in range(max(1, connections))]
+        self.conn = self.conns[0]
+        self.idle = list(self.conns)
+        self.pending = collections.deque()
+        self.curs = None
+        self.rows = []
+
+    ####
+    # the blocking interface, on the first connection
+    ####
+
+    def cursor(self):
+        from psycopg2.extras import DictCursor
+        wait(self.conn)
+        return self.conn.cursor(cursor_factory=DictCursor)
+
+    def execute(self, sql, args=None):
+        curs = self.cursor()
+        curs.execute(sql, args)
+        wait(self.conn)
+        self.rows = curs.fetchall() if curs.description else []
+
+    def fetchall(self):
+        return self.rows
+
+    def stream(self, sql, args=None):
+        # asynchronous connections can't have server side cursors
+        self.execute(sql, args)
+        for row in self.rows:
+            yield dict(row)
+
+    def mogrify(self, *args):
+        return self.cursor().mogrify(*args)
+
+    @property
+    def server_version(self):
+        wait(self.conn)
+        return self.conn.server_version
+
+    def close(self):
+        for conn in self.conns:
+            conn.close()
+
+    ####
+    # the asyncio interface
+    ####
+
+    def query(self, sql, args=None):
+        # a future of the rows, run on the next idle connection
+        asyncio = get_asyncio()
+        future = asyncio.Future(loop=asyncio.get_event_loop())
+        self.pending.append((sql, args, future))
+        self.dispatch()
+        return future
+
+    def dispatch(self):
+        from psycopg2.extras import DictCursor
+        loop = get_asyncio().get_event_loop()
+        while self.idle and self.pending:
+            conn = self.idle.pop()
+            sql, args, future = self.pending.popleft()
+            def finish(conn, future, error=None, rows=None):
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(rows)
+                self.idle.append(conn)
+                self.dispatch()
+            def ready(f, conn=conn, sql=sql, args=args, future=future):
+                # the connection is up (or was already), send the query
+                if f.exception() is not None:
+                    return finish(conn, future, error=f.exception())
+                try:
+                    curs = conn.cursor(cursor_factory=DictCursor)
+                    curs.execute(sql, args)
+                except Exception as e:
+                    return finish(conn, future, error=e)
+                poll(loop, conn).add_done_callback(lambda f: done(f, conn, curs, future))
+            def done(f, conn, curs, future):
+                if f.exception() is not None:
+                    return finish(conn, future, error=f.exception())
+                finish(conn, future, rows=curs.fetchall() if curs.description else [])
+            poll(loop, conn).add_done_callback(ready)
+
+    def introspect(self, *names):
+        # a future of a Schema per name, fully loaded with one round of bulk
+        # queries running concurrently; later lookups (types while rendering)
+        # go through the blocking interface
+        asyncio = get_asyncio()
+        loop = asyncio.get_event_loop()
+        db = PrefetchedDatabase(self)
+        schemas = [Schema(database=db, name=name) for name in names]
+        result = asyncio.Future(loop=loop)
+
+        def columns(f):
+            # columns need the tables first
+            if f.exception() is None:
+                return load(db, lambda: Schema.load_columns([t for s in schemas for t in s._tables.values()]))
+            return f
+
+        def chain(first, then):
+            future = asyncio.Future(loop=loop)
+            def step(f):
+                g = then(f)
+                g.add_done_callback(lambda g: future.set_exception(g.exception()) if g.exception() else future.set_result(None))
+            first.add_done_callback(step)
+            return future
+
+        def finished(f):
+            if f.exception() is not None:
+                result.set_exception(f.exception())
+                return
+            for schema in schemas:
+                schema.db = self
+            result.set_result(schemas)
+
+        def start(f):
+            # the loaders check the server version before anything else
+            if f.exception() is not None:
+                result.set_exception(f.exception())
+                return
+            db.version = f.result()[0][0]
+            asyncio.gather(
+                load(db, lambda: Schema.load_sequences(schemas)),
+                chain(load(db, lambda: Schema.load_tables(schemas)), columns),
+                load(db, lambda: Schema.load_constraints(schemas)),
+                load(db, lambda: Schema.load_indexes(schemas)),
+            ).add_done_callback(finished)
+
+        self.query("SELECT current_setting('server_version_num')::int").add_done_callback(start)
+        return result
+
+def load(db, loader):
+    # a future resolved once loader() gets through against the PrefetchedDatabase
+    # db, running each query it stops on with Pending on the pool in between
+    asyncio = get_asyncio()
+    future = asyncio.Future(loop=asyncio.get_event_loop())
+    def attempt():
+        try:
+            loader()
+        except Pending as e:
+            pending = e
+            db.db.query(pending.sql, pending.args).add_done_callback(lambda f: fetched(f, pending))
+            return
+        except Exception as e:
+            future.set_exception(e)
+            return
+        future.set_result(None)
+    def fetched(f, pending):
+        if f.exception() is not None:
+            future.set_exception(f.exception())
+            return
+        db.add(pending.sql, pending.args, f.result())
+        attempt()
+    attempt()
+    return future
@@ -0,0 +1,117 @@
+class Impact(object):
+    def __init__(self, change, table=None, lock=None, work=None, others=None):
+        self.change = change
+        self.table = table
+        self.lock = lock
+        self.work = work
+        # {table: lock} for the other tables it locks, like the one a foreign
+        # key points at
+        self.others = others or {}
+        # filled in from pg_class by analyze(), None when unknown; rows
+        # stays None for tables that were never vacuumed or analyzed
+        self.size = None
+        self.total_size = None
+        self.rows = None
+        self.seconds = None
+
+    @property
+    def rewrite(self):
+        return self.work in ("rewrite",)
+
+    @property
+    def scan(self):
+        return self.work is not None
+
+    def __str__(self):
+        if not self.lock:
+            return "no table locks"
+        ret = "%s lock on %s" % (self.lock, self.table)
+        if self.work:
+            ret += ", %s" % {"scan": "scans it", "index": "builds an index", "rewrite": "rewrites it"}[self.work]
+        if self.size is not None:
+            ret += ", %s" % format_size(self.size)
+        if self.rows is not None:
+            # reltuples, as of the last VACUUM or ANALYZE
+            ret += " in ~%d rows" % self.rows
+        if self.seconds is not None:
+            ret += ", ~%s" % format_duration(self.seconds)
+        for table in sorted(self.others):
+            ret += ", %s lock on %s" % (self.others[table], table)
+        return ret
+
+# rough throughputs in bytes per second, for the estimates
+SCAN_RATE = 200 * 1024 * 1024
+INDEX_RATE = 50 * 1024 * 1024
+REWRITE_RATE = 40 * 1024 * 1024
+
+def analyze(changes, database=None):
+    # work out the lock, the kind of work and an estimated duration for each
+    # change, with the sizes of every table involved fetched in one query
+    # against the target database (by default, the one the changes apply to)
+    impacts = [Impact(change, **change.impact()) for change in changes]
+    if not impacts:
+        return impacts
+    schema = impacts[0].change.that.schema
+    db = database or schema.db
+    tables = sorted(set(i.table for i in impacts if i.table))
+    sizes = {}
+    if tables and db.conn is not None:
+        db.execute(
+            "SELECT c.relname, pg_relation_size(c.oid) AS size, pg_total_relation_size(c.oid) AS total_size, " +
+                "CASE WHEN c.reltuples < 0 THEN NULL ELSE c.reltuples::bigint END AS rows " +
+            "FROM pg_class c JOIN pg_namespace n ON (n.oid = c.relnamespace) " +
+            "WHERE n.nspname = %s AND c.relname = ANY(%s) AND c.relkind IN ('r', 'p', 'm')",
+            (schema.name, tables)
+        )
+        sizes = dict((row["relname"], row) for row in db.fetchall())
+    for impact in impacts:
+        if impact.table in sizes:
+            row = sizes[impact.table]
+            impact.size, impact.total_size, impact.rows = row["size"], row["total_size"], row["rows"]
+        elif db.conn is not None and impact.table:
+            # not there yet, so nothing to read
+            impact.size = impact.total_size = impact.rows = 0
+        impact.seconds = estimate(impact)
+    return impacts
+
+def estimate(impact):
+    # seconds spent reading or writing the table's rows, None when its size
+    # isn't known.  catalog-only changes count as free, lock waits aren't
+    # accounted for
+    if not impact.work:
+        return 0.0
+    if impact.size is None:
+        return None
+    if impact.rewrite:
+        # the heap gets rewritten and every index rebuilt
+        return float(impact.size) / REWRITE_RATE + float(impact.total_size - impact.size) / INDEX_RATE
+    if impact.work in ("index",):
+        return float(impact.size) / INDEX_RATE
+    return float(impact.size) / SCAN_RATE
+
+def format_size(size):
+    if size < 1024:
+        return "%dB" % size
+    for unit in ("kB", "MB", "GB", "TB"):
+        size /= 1024.0
+        if size < 1024 or unit == "TB":
+            return "%.1f%s" % (size, unit)
+
+def format_duration(seconds):
+    if seconds < 60:
+        return "%.1fs" % seconds
+    if seconds < 3600:
+        return "%.1fm" % (seconds / 60)
+    return "%.1fh" % (seconds / 3600)
+
+def summarize(impacts):
+    # one line on the whole migration: estimated time and the heaviest locks
+    known = [i.seconds for i in impacts if i.seconds is not None]
+    ret = "estimated %s" % format_duration(sum(known))
+    unknown = len(impacts) - len(known)
+    if unknown:
+        ret += " (%d changes on tables of unknown size)" % unknown
+    rewrites = sorted(set(i.table for i in impacts if i.rewrite))
+    if rewrites:
+        ret += ", rewrites %s" % ", ".join(rewrites)
+    return ret
@@ -0,0 +1,150 @@
+from pypgdiff.scheduler import Scheduler
+
+class AppliedChange(object):
+    def __init__(self, change, steps):
+        # steps as from BaseChange.steps, rendered up front
+        self.change = change
+        self.steps = steps
+        self.statements = [statement for step in steps for statement in step]
+        self.sql = "\n".join(sql for sql, transactional in self.statements)
+        # how long each statement took, None for the ones that never ran
+        self.timings = [None] * len(self.statements)
+        self.error = None
+        # set when something this change depends on failed
+        self.skipped = False
+
+    @property
+    def seconds(self):
+        # time spent in this change's statements, None if none of them ran
+        ran = [t for t in self.timings if t is not None]
+        return sum(ran) if ran else None
+
+    @property
+    def ok(self):
+        return self.seconds is not None and self.error is None
+
+    @property
+    def status(self):
+        if self.skipped:
+            return "skipped"
+        if self.error is not None:
+            if self.seconds is None:
+                return "failed: %s" % str(self.error).strip()
+            return "failed after %.2fs: %s" % (self.seconds, str(self.error).strip())
+        return "ok in %.2fs" % self.seconds
+
+def apply_changes(changes, connect, jobs=1, callback=None, search_path=None):
+    # run changes against the database, over up to jobs connections opened
+    # with connect().  each change starts as soon as everything it depends on
+    # (see pypgdiff.scheduler) has been applied.  each of its steps runs in a
+    # transaction of its own (see BaseChange.steps), and each statement is
+    # timed.  when a change fails only the changes depending on it are
+    # skipped, and the rest carry on.  callback is called with each
+    # AppliedChange as it finishes; returns all of them, in the order they
+    # were scheduled.
+    # some statements name objects without a schema, so connections search
+    # search_path first, which defaults to the schema being changed
+    import threading, time
+    try:
+        import queue
+    except ImportError:
+        import Queue as queue
+
+    scheduler = Scheduler(changes)
+    # render up front, some changes look things up in the source schema
+    results = [AppliedChange(change, change.steps) for change in scheduler.changes]
+    if search_path is None and results:
+        search_path = '"%s"' % results[0].change.that.schema.name.replace('"', '""')
+    waiting = [len(requires) for requires in scheduler.requires]
+    ready = queue.Queue()
+    done = queue.Queue()
+
+    def work():
+        conn = None
+        while True:
+            index = ready.get()
+            if index is None:
+                break
+            result = results[index]
+            try:
+                if conn is None:
+                    conn = connect()
+                    conn.autocommit = True
+                    if search_path:
+                        conn.cursor().execute("SELECT set_config('search_path', %s, false)", (search_path,))
+                i = 0
+                for step in result.steps:
+                    # a lone statement is its own transaction, CONCURRENTLY
+                    # can't be in one at all
+                    atomic = len(step) > 1
+                    curs = conn.cursor()
+                    if atomic:
+                        curs.execute("BEGIN")
+                    try:
+                        # one at a time, CONCURRENTLY can't share a query with anything else
+                        for sql, transactional in step:
+                            start = time.time()
+                            try:
+                                curs.execute(sql)
+                            finally:
+                                result.timings[i] = time.time() - start
+                                i += 1
+                        if atomic:
+                            curs.execute("COMMIT")
+                    except Exception:
+                        if atomic:
+                            conn.cursor().execute("ROLLBACK")
+                        raise
+            except Exception as e:
+                result.error = e
+            done.put(index)
+        if conn is not None:
+            conn.close()
+
+    threads = [threading.Thread(target=work) for i in range(max(1, min(jobs, len(results))))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    try:
+        for index, count in enumerate(waiting):
+            if not count:
+                ready.put(index)
+        for i in range(len(results)):
+            index = done.get()
+            result = results[index]
+            if callback:
+                callback(result)
+            for after in scheduler.dependents[index]:
+                if not result.ok:
+                    results[after].skipped = True
+                waiting[after] -= 1
+                if not waiting[after]:
+                    # skipped changes finish without going near a connection
+                    (done if results[after].skipped else ready).put(after)
+    finally:
+        for thread in threads:
+            ready.put(None)
+        for thread in threads:
+            thread.join()
+    return results
+
+def summarize(results, slowest=5):
+    # a few lines on how applying went: counts, failures and the slowest statements
+    ok = [r for r in results if r.ok]
+    failed = [r for r in results if r.error is not None]
+    skipped = [r for r in results if r.skipped]
+    lines = ["%d applied, %d failed, %d skipped, %.2fs spent in statements" % (
+        len(ok), len(failed), len(skipped), sum(r.seconds for r in results if r.seconds)
+    )]
+    for result in failed:
+        lines.append("failed: %s" % result.sql.splitlines()[0])
+        lines.append("    %s" % str(result.error).strip())
+    ran = []
+    for result in results:
+        for (sql, transactional), seconds in zip(result.statements, result.timings):
+            if seconds is not None:
+                ran.append((seconds, sql))
+    ran.sort(key=lambda x: -x[0])
+    for seconds, sql in ran[:slowest]:
+        lines.append("%8.2fs %s" % (seconds, sql.splitlines()[0]))
+    return "\n".join(lines)
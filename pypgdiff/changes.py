@@ -1,3 +1,34 @@
+def identifiers(text):
+    # every bare word in an expression, close enough to find the columns it uses
+    import re
+    return set(re.findall("[A-Za-z_][A-Za-z0-9_$]*", text or ""))
+
+def sequence_of(column):
+    # the sequence a column's nextval() default draws from, if any
+    import re
+    match = re.search("nextval\\('([^']+)'", column.props.get("column_default") or "")
+    if match:
+        return match.group(1).split(".")[-1].strip('"')
+
+# the kinds of work a change can do on a table's rows, cheapest first
+WORK = (None, "scan", "index", "rewrite")
+
+def is_volatile(expr):
+    # whether a default has to be worked out row by row, close enough for the
+    # usual suspects
+    import re
+    return bool(re.search("(nextval|random|clock_timestamp|timeofday|gen_random_uuid|uuid_generate_v[0-9a-z]+)\\s*\\(", expr or ""))
+
+def rendered(change):
+    # a change's statements as text to print, flagging the ones that have to
+    # run outside a transaction block
+    ret = []
+    for sql, transactional in change.statements:
+        if not transactional:
+            sql = "-- must run outside a transaction block\n" + sql
+        ret.append(sql)
+    return ret
+
 class BaseChange(object):
     priority = 0
 
@@ -32,7 +63,44 @@ class BaseChange(object):
 
     @property
     def sql(self):
-        return self.__sql__()
+        return "\n".join(sql for sql, transactional in self.statements)
+
+    @property
+    def statements(self):
+        # the statements making up this change, as (sql, transactional) pairs,
+        # transactional being False for the ones that can't run inside a
+        # transaction block.  in online mode, these should run one at a time
+        return [(self.__sql__(), True)]
+
+    @property
+    def steps(self):
+        # statements grouped the way they get applied: consecutive
+        # transactional ones share a transaction, so a change isn't left half
+        # done when one of them fails, and the others run on their own
+        ret = []
+        for statement in self.statements:
+            if ret and statement[1] and ret[-1][-1][1]:
+                ret[-1].append(statement)
+            else:
+                ret.append([statement])
+        return ret
+
+    def resources(self):
+        # what this change does to the objects around it, for the scheduler:
+        #   creates - things that exist after this change
+        #   needs   - things that must exist before this change
+        #   drops   - things that are gone after this change
+        #   holds   - things that must not be dropped before this change
+        return {}
+
+    def impact(self):
+        # what this change does to the table it touches, for the analysis:
+        #   table  - the table it works on
+        #   lock   - the strongest lock it takes on that table
+        #   others - {table: lock} for any other table it locks
+        #   work   - "scan", "index" or "rewrite" for anything reading the
+        #            table, None when only the catalog changes
+        return {}
 
 ################################################################################
 ## TABLES
@@ -52,6 +120,17 @@ class CreateTable(BaseChange):
         ret += ");"
         return ret
 
+    def impact(self):
+        # nothing can see the new table yet
+        return {"table": self.this.name, "lock": "ACCESS EXCLUSIVE"}
+
+    def resources(self):
+        cols = self.this.get_columns().values()
+        return {
+            "creates" : [("table", self.this.name)] + [("column", self.this.name, col.name) for col in cols],
+            "needs"   : [("sequence", sequence_of(col)) for col in cols if sequence_of(col)],
+        }
+
 class DropTable(BaseChange):
     priority = 20
     def __sql__(self):
@@ -60,6 +139,16 @@ class DropTable(BaseChange):
             self.that.name
         )
 
+    def impact(self):
+        return {"table": self.that.name, "lock": "ACCESS EXCLUSIVE"}
+
+    def resources(self):
+        cols = self.that.get_columns().values()
+        return {
+            "drops" : [("table", self.that.name)] + [("column", self.that.name, col.name) for col in cols],
+            "holds" : [("sequence", sequence_of(col)) for col in cols if sequence_of(col)],
+        }
+
 class AlterTable(BaseChange):
     priority = 70
     def __sql__(self):
@@ -77,6 +166,26 @@ class AlterTable(BaseChange):
         ret += ";"
         return ret
 
+    def impact(self):
+        work = None
+        for change in self.cs:
+            work = max(work, change.work(), key=WORK.index)
+        return {"table": self.that.name, "lock": "ACCESS EXCLUSIVE", "work": work}
+
+    def resources(self):
+        table = self.that.name
+        ret = {"creates": [], "needs": [("table", table)], "drops": [], "holds": [], "locks": [table]}
+        for change in self.cs:
+            if change.this:
+                ret["creates"].append(("column", table, change.this.name))
+                if sequence_of(change.this):
+                    ret["needs"].append(("sequence", sequence_of(change.this)))
+            if change.that:
+                ret["drops"].append(("column", table, change.that.name))
+                if sequence_of(change.that):
+                    ret["holds"].append(("sequence", sequence_of(change.that)))
+        return ret
+
 class CreateColumn(BaseChange):
     priority = 70
     def __sql__(self):
@@ -119,6 +228,7 @@ class AddColumn(BaseChange):
                 value = self.this.table.schema.get_default(self.this)
                 if value is not Undefined:
                     self.this.props["column_default"] = self.this.mogrify(value)
+                    self.this.invalidate_fingerprint()
         except AttributeError:
             # grossitude for tests
             pass
@@ -126,11 +236,21 @@ class AddColumn(BaseChange):
     def __sql__(self):
         return "ADD COLUMN %s" % CreateColumn(self.this, None).sql
 
+    def work(self):
+        default = self.this.props["column_default"]
+        # since 11, a constant default is stored in the catalog instead of
+        # being written to every row
+        if is_volatile(default) or (default and self.that.table.schema.db.server_version < 110000):
+            return "rewrite"
+
 class DropColumn(BaseChange):
     priority = 71
     def __sql__(self):
         return "DROP COLUMN %s" % self.that.safe_name
 
+    def work(self):
+        return None
+
 class AlterColumn(BaseChange):
     priority = 73
 
@@ -145,6 +265,7 @@ class AlterColumn(BaseChange):
                 value = self.this.table.schema.get_default(self.this)
                 if value is not Undefined:
                     self.this.props["column_default"] = self.this.mogrify(value)
+                    self.this.invalidate_fingerprint()
         except AttributeError:
             # grossitude for tests
             pass
@@ -170,6 +291,24 @@ class AlterColumn(BaseChange):
                 ret += ["ALTER COLUMN %s DROP NOT NULL" % self.that.safe_name]
         return ret
 
+    @property
+    def sql(self):
+        # a list of clauses for AlterTable to stitch together, not a statement
+        return self.__sql__()
+
+    @property
+    def statements(self):
+        return [(sql, True) for sql in self.__sql__()]
+
+    def work(self):
+        old, new = self.that.props["data_type"], self.this.props["data_type"]
+        # varchar to text, or to any varchar, is binary coercible, anything else is rewritten
+        if old != new and not (old == "character varying" and new in ("text", "character varying")):
+            return "rewrite"
+        if self.this.props["is_nullable"] != self.that.props["is_nullable"] and self.this.props["is_nullable"] in ("NO",):
+            # every row is checked for NULLs
+            return "scan"
+
 ################################################################################
 ## SEQUENCES
 ################################################################################
@@ -199,6 +338,9 @@ class CreateSequence(BaseChange):
         ret += ";"
         return ret
 
+    def resources(self):
+        return {"creates": [("sequence", self.this.name)]}
+
 class DropSequence(BaseChange):
     priority = 30
     def __sql__(self):
@@ -207,6 +349,9 @@ class DropSequence(BaseChange):
             self.that.name
         )
 
+    def resources(self):
+        return {"drops": [("sequence", self.that.name)]}
+
 class AlterSequence(BaseChange):
     priority = 50
     def __sql__(self):
@@ -261,9 +406,46 @@ class AlterSequence(BaseChange):
 ## CONSTRAINTS
 ################################################################################
 
+def constraint_resources(constraint):
+    # (what the constraint provides, what it relies on) as scheduler resources
+    props = constraint.props
+    table = props["table_name"]
+    provides = [("constraint", table, constraint.name)]
+    uses = [("table", table)]
+    if props["constraint_type"] in ("PRIMARY KEY", "UNIQUE"):
+        provides.append(("key", table, frozenset(props["columns"])))
+        uses += [("column", table, col) for col in props["columns"]]
+    if props["constraint_type"] in ("FOREIGN KEY",):
+        other = props["to"][0]["table_name"]
+        uses += [("column", table, x["column_name"]) for x in props["from"]]
+        uses += [("table", other), ("key", other, frozenset([x["column_name"] for x in props["to"]]))]
+        uses += [("column", other, x["column_name"]) for x in props["to"]]
+    if props["constraint_type"] in ("CHECK",):
+        uses += [("column", table, word) for word in identifiers(props["clause"])]
+    return provides, uses
+
+def constraint_locks(constraint):
+    # ALTER TABLE locks the table, and a foreign key the table it points at too
+    props = constraint.props
+    if props["constraint_type"] in ("FOREIGN KEY",):
+        return [props["table_name"], props["to"][0]["table_name"]]
+    return [props["table_name"]]
+
+def referenced_locks(constraint, lock):
+    # {table: lock} for the table a foreign key points at, for impact()
+    props = constraint.props
+    referenced = props["to"][0]["table_name"]
+    if referenced == props["table_name"]:
+        return {}
+    return {referenced: lock}
+
 class CreateConstraint(BaseChange):
-    @property
-    def priority(self):
+    def __init__(self, this, that, changeset=None):
+        super(CreateConstraint, self).__init__(this, that, changeset)
+        # depends on the constraint type, so work it out once up front
+        self.priority = self.get_priority()
+
+    def get_priority(self):
         try:
             if self.this.props["constraint_type"] in ("UNIQUE",):
                 return 80
@@ -305,9 +487,66 @@ class CreateConstraint(BaseChange):
         ret += ";"
         return ret
 
-class DropConstraint(BaseChange):
     @property
-    def priority(self):
+    def statements(self):
+        from pypgdiff import Config
+        if not Config().online:
+            return super(CreateConstraint, self).statements
+        table = "%s.%s" % (self.that.schema.name, self.this.props["table_name"])
+        if self.this.props["constraint_type"] in ("PRIMARY KEY", "UNIQUE"):
+            # build the index without blocking writes, then turn it into the constraint
+            return [
+                ("CREATE UNIQUE INDEX CONCURRENTLY %s ON %s (%s);" % (
+                    self.this.name,
+                    table,
+                    ", ".join(sorted(self.this.props["columns"]))
+                ), False),
+                ("ALTER TABLE %s\n    ADD CONSTRAINT %s %s USING INDEX %s;" % (
+                    table,
+                    self.this.name,
+                    self.this.props["constraint_type"],
+                    self.this.name
+                ), True),
+            ]
+        # only check new rows while adding it, existing ones get checked
+        # under a weaker lock by VALIDATE
+        return [
+            (self.__sql__()[:-1] + " NOT VALID;", True),
+            ("ALTER TABLE %s\n    VALIDATE CONSTRAINT %s;" % (table, self.this.name), True),
+        ]
+
+    @property
+    def steps(self):
+        from pypgdiff import Config
+        if not Config().online:
+            return super(CreateConstraint, self).steps
+        # the stronger lock taken while adding it has to be let go of before
+        # VALIDATE, or there's no point
+        return [[statement] for statement in self.statements]
+
+    def impact(self):
+        # the strongest lock across its statements: online mode only moves the
+        # slow part under a weaker lock, attaching the index with USING INDEX
+        # and adding a CHECK, NOT VALID or not, still take ACCESS EXCLUSIVE
+        table = self.this.props["table_name"]
+        if self.this.props["constraint_type"] in ("PRIMARY KEY", "UNIQUE"):
+            return {"table": table, "lock": "ACCESS EXCLUSIVE", "work": "index"}
+        if self.this.props["constraint_type"] in ("FOREIGN KEY",):
+            return {"table": table, "lock": "SHARE ROW EXCLUSIVE", "work": "scan",
+                    "others": referenced_locks(self.this, "SHARE ROW EXCLUSIVE")}
+        return {"table": table, "lock": "ACCESS EXCLUSIVE", "work": "scan"}
+
+    def resources(self):
+        provides, uses = constraint_resources(self.this)
+        return {"creates": provides, "needs": uses, "locks": constraint_locks(self.this)}
+
+class DropConstraint(BaseChange):
+    def __init__(self, this, that, changeset=None):
+        super(DropConstraint, self).__init__(this, that, changeset)
+        # depends on the constraint type, so work it out once up front
+        self.priority = self.get_priority()
+
+    def get_priority(self):
         try:
             if self.that.props["constraint_type"] in ("FOREIGN KEY",):
                 return 10
@@ -327,10 +566,36 @@ class DropConstraint(BaseChange):
         ret += "    DROP CONSTRAINT %s;" % self.that.name
         return ret
 
+    def impact(self):
+        # a foreign key's triggers go with it, on both tables
+        if self.that.props["constraint_type"] in ("FOREIGN KEY",):
+            return {"table": self.that.props["table_name"], "lock": "ACCESS EXCLUSIVE",
+                    "others": referenced_locks(self.that, "ACCESS EXCLUSIVE")}
+        return {"table": self.that.props["table_name"], "lock": "ACCESS EXCLUSIVE"}
+
+    def resources(self):
+        provides, uses = constraint_resources(self.that)
+        return {"drops": provides, "holds": uses, "locks": constraint_locks(self.that)}
+
 ################################################################################
 ## INDEXES
 ################################################################################
 
+def index_resources(index):
+    # (what the index provides, what it relies on) as scheduler resources
+    table = index.props["tablename"]
+    indexdef = index.props["indexdef"]
+    columns = identifiers(indexdef[indexdef.find(" USING "):])
+    return [("index", index.name)], [("table", table)] + [("column", table, col) for col in columns]
+
+def index_locks(index):
+    # plain index builds on one table share it happily, but CONCURRENTLY
+    # ones wait on each other and can deadlock, so those go one at a time
+    from pypgdiff import Config
+    if Config().online:
+        return [index.props["tablename"]]
+    return []
+
 class CreateIndex(BaseChange):
     priority = 90
     def __sql__(self):
@@ -342,6 +607,23 @@ class CreateIndex(BaseChange):
             self.this.props["indexdef"]
         ) + ";"
 
+    @property
+    def statements(self):
+        import re
+        from pypgdiff import Config
+        if Config().online:
+            return [(re.sub("^CREATE (UNIQUE INDEX|INDEX) ", "CREATE \\1 CONCURRENTLY ", self.__sql__()), False)]
+        return super(CreateIndex, self).statements
+
+    def impact(self):
+        from pypgdiff import Config
+        lock = "SHARE UPDATE EXCLUSIVE" if Config().online else "SHARE"
+        return {"table": self.this.props["tablename"], "lock": lock, "work": "index"}
+
+    def resources(self):
+        provides, uses = index_resources(self.this)
+        return {"creates": provides, "needs": uses, "locks": index_locks(self.this)}
+
 class DropIndex(BaseChange):
     priority = 0
     def __sql__(self):
@@ -349,3 +631,19 @@ class DropIndex(BaseChange):
             self.that.schema.name,
             self.that.name
         )
+
+    @property
+    def statements(self):
+        from pypgdiff import Config
+        if Config().online:
+            return [("DROP INDEX CONCURRENTLY %s.%s;" % (self.that.schema.name, self.that.name), False)]
+        return super(DropIndex, self).statements
+
+    def impact(self):
+        from pypgdiff import Config
+        lock = "SHARE UPDATE EXCLUSIVE" if Config().online else "ACCESS EXCLUSIVE"
+        return {"table": self.that.props["tablename"], "lock": lock}
+
+    def resources(self):
+        provides, uses = index_resources(self.that)
+        return {"drops": provides, "holds": uses, "locks": index_locks(self.that)}
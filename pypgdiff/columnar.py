@@ -0,0 +1,112 @@
+# the fields AlterColumn can do something about; columns that only differ
+# elsewhere (collation, identity, ...) don't produce anything worth running
+FIELDS = ("data_type", "udt_name", "character_maximum_length", "numeric_precision",
+          "numeric_scale", "column_default", "is_nullable")
+
+def get_numpy():
+    # numpy is optional, without it the masks are built with plain lists
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        return None
+
+class ColumnStore(object):
+    # every column of a set of tables as parallel arrays sorted by (table,
+    # column): the table name, the column name and the values of FIELDS -
+    # one array per field with numpy, a tuple per column without.
+    # comparing two stores is a single merge-join plus equality masks,
+    # instead of comparing props dict by dict
+    def __init__(self, tables, use_numpy=True):
+        # tables is {name: Table}, as from Schema.get_tables()
+        from operator import itemgetter
+        from pypgdiff.objects import Props
+        self.numpy = get_numpy() if use_numpy else None
+        self.tables = sorted(tables)
+        self.keys = []
+        values = []
+        getters = {}
+        for table in self.tables:
+            columns = tables[table].get_columns()
+            for name in sorted(columns):
+                props = columns[name].props
+                if isinstance(props, Props):
+                    # straight off the shared layout, one getter per layout
+                    layout = props._layout
+                    try:
+                        getter = getters[id(layout)]
+                    except KeyError:
+                        getter = getters[id(layout)] = (itemgetter(*[layout[1][f] for f in FIELDS]) if set(FIELDS) <= set(layout[0]) else None)
+                    if getter is not None:
+                        values.append(getter(props._values))
+                        self.keys.append((table, name))
+                        continue
+                values.append(tuple(props.get(f) for f in FIELDS))
+                self.keys.append((table, name))
+        if self.numpy is not None:
+            columns = list(zip(*values)) or [()] * len(FIELDS)
+            self.fields = dict((field, self.numpy.array(column, dtype=object)) for field, column in zip(FIELDS, columns))
+        else:
+            self.values = values
+
+    def __len__(self):
+        return len(self.keys)
+
+    def join(self, other):
+        # merge-join on (table, column): the indexes of the matching rows on
+        # each side, and the rows only found on one side or the other
+        left, right, only_self, only_other = [], [], [], []
+        k1, k2 = self.keys, other.keys
+        n1, n2 = len(k1), len(k2)
+        i = j = 0
+        while i < n1 and j < n2:
+            if k1[i] == k2[j]:
+                left.append(i)
+                right.append(j)
+                i += 1
+                j += 1
+            elif k1[i] < k2[j]:
+                only_self.append(i)
+                i += 1
+            else:
+                only_other.append(j)
+                j += 1
+        only_self.extend(range(i, n1))
+        only_other.extend(range(j, n2))
+        return left, right, only_self, only_other
+
+    def differs(self, other, left, right):
+        # for each matched pair, whether any field differs
+        numpy = self.numpy
+        if numpy is not None and other.numpy is not None:
+            left, right = numpy.array(left, dtype=int), numpy.array(right, dtype=int)
+            mask = numpy.zeros(len(left), dtype=bool)
+            for field in FIELDS:
+                mask |= self.fields[field][left] != other.fields[field][right]
+            return mask.tolist()
+        a, b = self.rows(), other.rows()
+        return [a[i] != b[j] for i, j in zip(left, right)]
+
+    def rows(self):
+        # a tuple of FIELDS per column
+        if self.numpy is None:
+            return self.values
+        return list(zip(*[self.fields[field].tolist() for field in FIELDS]))
+
+    def diff(self, other):
+        # {table: {column: "add", "drop" or "alter"}} for the tables in both
+        # stores, with self as the source like Schema.__or__; tables that
+        # don't change are left out
+        ret = {}
+        both = set(self.tables) & set(other.tables)
+        left, right, only_self, only_other = self.join(other)
+        for i, changed in zip(left, self.differs(other, left, right)):
+            if changed:
+                table, name = self.keys[i]
+                ret.setdefault(table, {})[name] = "alter"
+        for store, indexes, action in ((self, only_self, "add"), (other, only_other, "drop")):
+            for i in indexes:
+                table, name = store.keys[i]
+                if table in both:
+                    ret.setdefault(table, {})[name] = action
+        return ret
@@ -0,0 +1,56 @@
+from pypgdiff import Config
+
+# per-process state, set up once by _init_worker in every pool process
+_worker = {}
+
+def _init_worker(snapshot, connect_kwargs, conf, defaults):
+    import psycopg2
+    from multiprocessing.util import Finalize
+    from pypgdiff.objects import Database, Schema
+    # rebuild the golden schema from its snapshot rather than introspecting it again
+    with Config(**conf):
+        _worker["golden"] = Schema.from_snapshot(snapshot, defaults=defaults)
+    # one transaction per query, so no locks on any tenant's catalog outlive
+    # its diff (a worker goes through many tenants)
+    conn = psycopg2.connect(**connect_kwargs)
+    conn.autocommit = True
+    Finalize(None, conn.close, exitpriority=0)
+    _worker["db"] = Database(conn=conn)
+    _worker["conf"] = conf
+    _worker["defaults"] = defaults
+
+def _diff_tenant(name):
+    import traceback
+    from pypgdiff.objects import Schema
+    from pypgdiff.changes import rendered
+    try:
+        with Config(**_worker["conf"]):
+            target = Schema(database=_worker["db"], name=name, defaults=_worker["defaults"])
+            return name, [sql for c in _worker["golden"] | target for sql in rendered(c)], None
+    except Exception:
+        # keep going with the other tenants, the caller decides what to do with failures
+        return name, None, traceback.format_exc()
+
+def fanout_diff(golden, names, connect_kwargs, processes=None, defaults={}, **conf):
+    # compare one golden schema against many target schemas using a pool of
+    # processes, each with its own connection made from connect_kwargs.
+    # yields (name, sql statements, error) as each target finishes, in
+    # completion order; error is a traceback string when the diff failed
+    import multiprocessing
+    from pypgdiff.objects import Schema
+    if not isinstance(golden, Schema):
+        golden = Schema.from_snapshot(golden, defaults=defaults)
+    # nobody is around to answer prompts inside the pool
+    conf.pop("prompt_for_defaults", None)
+    with Config(**conf):
+        snapshot = golden.to_snapshot()
+    pool = multiprocessing.Pool(processes, _init_worker, (snapshot, connect_kwargs, conf, defaults))
+    try:
+        for result in pool.imap_unordered(_diff_tenant, names):
+            yield result
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
@@ -1,6 +1,176 @@
 from pypgdiff import Changeset, Config, NOW
 
+def native(value):
+    # json hands back unicode, while psycopg2 gives python 2 byte strings
+    if str is bytes:
+        if isinstance(value, unicode):
+            return value.encode("utf-8")
+        if isinstance(value, list):
+            return [native(x) for x in value]
+    return value
+
+def native_strings(d):
+    if str is bytes:
+        return dict((native(k), native(v)) for k, v in d.items())
+    return d
+
+def write_snapshot(path, data):
+    import gzip, json, os
+    opener = gzip.open if path.endswith(".gz") else open
+    # write to the side and move into place, so readers never see half a file
+    tmp = "%s.%s.tmp" % (path, os.getpid())
+    with opener(tmp, "wb") as f:
+        f.write(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+    os.rename(tmp, path)
+
+def read_snapshot(path):
+    import gzip, json
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        return json.loads(f.read().decode("utf-8"), object_hook=native_strings)
+
+def content_hash(value):
+    # md5 of a canonical JSON rendering: sorted keys, sets as sorted lists
+    import hashlib, json
+    def default(o):
+        if isinstance(o, (set, frozenset)):
+            return sorted(o)
+        if isinstance(o, Props):
+            return o.copy()
+        return str(o)
+    return hashlib.md5(json.dumps(value, sort_keys=True, separators=(",", ":"), default=default).encode("utf-8")).hexdigest()
+
+def utf8(text):
+    # bytes for hashing: python 2 strings from psycopg2 already are, only
+    # unicode needs encoding (names and defaults can be anything)
+    if isinstance(text, bytes):
+        return text
+    return text.encode("utf-8")
+
+def hash_children(children):
+    # one hash over a {key: object} mapping, from the objects' fingerprints
+    import hashlib
+    return hashlib.md5(utf8("\n".join("%s:%s" % (key, children[key].fingerprint) for key in sorted(children)))).hexdigest()
+
+def run_concurrently(*funcs):
+    # call each function in its own thread, returning their results in order
+    import threading
+    results = [None] * len(funcs)
+    errors = []
+    def run(index, func):
+        try:
+            results[index] = func()
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=run, args=(i, f)) for i, f in enumerate(funcs)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+def intern_value(value):
+    # one copy of each repeated string ("YES", "integer", ...) across objects
+    if type(value) is str:
+        try:
+            return intern(value)
+        except NameError:
+            import sys
+            return sys.intern(value)
+    return value
+
+class Props(object):
+    # the catalog fields of one object, stored compactly: objects with the same
+    # set of fields share one sorted tuple of names (and the index into it),
+    # each only keeps a list of values.  reads and writes like a dict
+    __slots__ = ("_layout", "_values")
+    _layouts = {}
+    __hash__ = None
+
+    def __init__(self, *args, **kwargs):
+        d = dict(*args, **kwargs)
+        self._layout = self.layout(d.keys())
+        self._values = [intern_value(d[key]) for key in self._layout[0]]
+
+    @classmethod
+    def layout(cls, keys):
+        keys = tuple(sorted(keys))
+        try:
+            return cls._layouts[keys]
+        except KeyError:
+            keys = tuple(intern_value(key) for key in keys)
+            return cls._layouts.setdefault(keys, (keys, dict((key, i) for i, key in enumerate(keys))))
+
+    def __getitem__(self, key):
+        return self._values[self._layout[1][key]]
+
+    def __setitem__(self, key, value):
+        index = self._layout[1].get(key)
+        if index is None:
+            d = dict(self)
+            d[key] = value
+            Props.__init__(self, d)
+        else:
+            self._values[index] = intern_value(value)
+
+    def __delitem__(self, key):
+        d = dict(self)
+        del d[key]
+        Props.__init__(self, d)
+
+    def __contains__(self, key):
+        return key in self._layout[1]
+    has_key = __contains__
+
+    def __iter__(self):
+        return iter(self._layout[0])
+
+    def __len__(self):
+        return len(self._values)
+
+    def __eq__(self, other):
+        if isinstance(other, Props):
+            return self._layout[0] == other._layout[0] and self._values == other._values
+        return dict(self) == other
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return "Props(%r)" % dict(self)
+
+    def keys(self):
+        return list(self._layout[0])
+
+    def values(self):
+        return list(self._values)
+
+    def items(self):
+        return list(zip(self._layout[0], self._values))
+
+    def get(self, key, default=None):
+        index = self._layout[1].get(key)
+        return default if index is None else self._values[index]
+
+    def copy(self):
+        return dict(self.items())
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def pop(self, key, *default):
+        if key not in self and default:
+            return default[0]
+        value = self[key]
+        del self[key]
+        return value
+
 class BaseObject(object):
+    __slots__ = ()
+
     def __or__(self, other):
         raise NotImplementedError()
 
@@ -28,7 +198,130 @@ class BaseObject(object):
     def comparison_props(self):
         return self.props
 
-class Database(BaseObject):
+    @property
+    def fingerprint(self):
+        # content hash of comparison_props, worked out once (per config, which
+        # comparison_props can depend on) so equality can check it first
+        key = (Config().normalize_constraints,)
+        cached = getattr(self, "_fingerprint", None)
+        if cached is None or cached[0] != key:
+            cached = self._fingerprint = (key, content_hash(self.comparison_props))
+        return cached[1]
+
+    def invalidate_fingerprint(self):
+        # for whoever changes props after the fact
+        self._fingerprint = None
+
+    def quote_ident(self, name):
+        # NOTE: also escapes % so the result can be embedded in a parameterized query
+        return '"%s"' % name.replace('"', '""').replace('%', '%%')
+
+class BaseDatabase(BaseObject):
+    # what a Schema needs from wherever its catalog comes from.  backends
+    # provide the queries: execute() followed by fetchall() for a result as
+    # rows readable by position or by column, stream() for a big one as
+    # dicts, batch() for several at once, mogrify() and server_version.
+    # the type catalog is built on top of those.  conn is the connection
+    # underneath, None when there isn't one (snapshots)
+    conn = None
+
+    def execute(self, sql, args=None):
+        raise NotImplementedError()
+
+    def fetchall(self):
+        raise NotImplementedError()
+
+    def stream(self, sql, args=None):
+        raise NotImplementedError()
+
+    def batch(self, queries):
+        # one query at a time, for backends that can't do better
+        ret = []
+        for query in queries:
+            self.execute(query[0], query[1])
+            ret.append(self.fetchall())
+        return ret
+
+    def mogrify(self, sql, args):
+        raise NotImplementedError()
+
+    @property
+    def server_version(self):
+        raise NotImplementedError()
+
+    def get_schemas(self, pattern=None):
+        # user schemas, optionally only those matching a (POSIX) regex
+        self.execute(
+            "SELECT nspname FROM pg_namespace WHERE " +
+                "nspname !~ '^pg_' AND nspname <> 'information_schema' AND " +
+                "(%s::text IS NULL OR nspname ~ %s) " +
+            "ORDER BY nspname",
+            (pattern, pattern)
+        )
+        return [x[0] for x in self.fetchall()]
+
+    def get_types(self):
+        # only the types resolved so far, shared by every schema on this database
+        try:
+            return self._type_info
+        except AttributeError:
+            pass
+        self._type_info = dict()
+        return self._type_info
+
+    def resolve_types(self, names=(), oids=(), namespaces=None):
+        # look up the given types (and their element types) in one query
+        # TODO: need a proper way to convert type names to SQL types
+        sql_types = {
+            "int2"  : "smallint",
+            "int4"  : "integer",
+            "int8"  : "bigint",
+            "bpchar": "character",
+        }
+        types = self.get_types()
+        names = [x for x in set(names) if x not in types]
+        oids = [x for x in set(oids) if x not in types]
+        if not names and not oids:
+            return types
+        self.execute(
+            "SELECT " +
+                "t.oid, t.typname, t.typelem, " +
+                "e.oid AS elem_oid, e.typname AS elem_typname, e.typelem AS elem_typelem " +
+            "FROM " +
+                "pg_type t " +
+                    "JOIN pg_namespace n ON (n.oid = t.typnamespace) " +
+                    "LEFT JOIN pg_type e ON (e.oid = t.typelem) " +
+            "WHERE " +
+                "(t.typname = ANY(%s::text[]) AND (%s::text[] IS NULL OR n.nspname = ANY(%s::text[]))) OR " +
+                "t.oid = ANY(%s::oid[])",
+            (names, namespaces, namespaces, oids)
+        )
+        for row in self.fetchall():
+            for oid, typname, typelem in (row[0:3], row[3:6]):
+                if oid is None:
+                    continue
+                info = {
+                    "oid"     : oid,
+                    "typname" : typname,
+                    "typelem" : typelem,
+                    "sql_type": sql_types.get(typname.replace("_", ""), typname),
+                }
+                types[typname] = types[oid] = info
+        return types
+
+    def type_info(self, udt_name):
+        # resolve on demand when introspection didn't already
+        import numbers
+        types = self.get_types()
+        if udt_name not in types:
+            if isinstance(udt_name, numbers.Integral):
+                self.resolve_types(oids=[udt_name])
+            else:
+                self.resolve_types(names=[udt_name])
+        return types.get(udt_name)
+
+class Database(BaseDatabase):
+    # the psycopg2 backend
     def __init__(self, conn):
         from psycopg2.extras import DictCursor
         self.conn = conn
@@ -40,42 +333,567 @@ class Database(BaseObject):
     def fetchall(self):
         return self.curs.fetchall()
 
+    # rows fetched per round trip by stream()
+    itersize = 2000
+
+    def stream(self, sql, args=()):
+        # run a query on a server side cursor and yield its rows as dicts, a
+        # batch of itersize at a time: memory stays bounded however big the
+        # result, and rows come off the wire as plain tuples, turned into a
+        # dict once
+        import itertools
+        from psycopg2.extensions import cursor
+        self._streams = getattr(self, "_streams", itertools.count(1))
+        # outside a transaction the cursor has to be held open
+        curs = self.conn.cursor("pypgdiff_stream_%d" % next(self._streams), cursor_factory=cursor, withhold=self.conn.autocommit)
+        try:
+            curs.itersize = self.itersize
+            curs.execute(sql, args)
+            names = None
+            for row in curs:
+                if names is None:
+                    names = [column[0] for column in curs.description]
+                yield dict(zip(names, row))
+        finally:
+            curs.close()
+
+    def mogrify(self, *args):
+        return self.curs.mogrify(*args)
+
+    def batch(self, queries):
+        # run several (sql, args) queries in one round trip: each one's rows
+        # come back as a json array, all of them in a single row.  returns a
+        # list of rows (as Row) per query; values arrive the way json has them,
+        # which suits catalog queries (text, integers, booleans and arrays).
+        # json_agg needn't keep the rows in the order the query sorted them,
+        # a query that cares gives an ORDER BY over the columns of q as a
+        # third item: (sql, args, "q.name")
+        import json
+        if not queries:
+            return []
+        parts = []
+        for query in queries:
+            sql = self.mogrify(query[0], query[1])
+            if not isinstance(sql, str):
+                sql = sql.decode("utf-8")
+            order = " ORDER BY %s" % query[2] if len(query) > 2 else ""
+            parts.append("(SELECT COALESCE(json_agg(q%s), '[]') FROM (%s) q)::text" % (order, sql))
+        self.execute("SELECT " + ", ".join(parts))
+        ret = []
+        for text in self.fetchall()[0]:
+            rows = []
+            columns = None
+            for pairs in json.loads(text, object_pairs_hook=lambda pairs: pairs):
+                if columns is None:
+                    names = tuple(native(k) for k, v in pairs)
+                    columns = (names, dict((name, i) for i, name in enumerate(names)))
+                rows.append(Row([native(v) for k, v in pairs], columns))
+            ret.append(rows)
+        return ret
+
+    @property
+    def server_version(self):
+        return self.conn.server_version
+
+class Row(list):
+    # a row from Database.batch, read by position or by column like psycopg2's
+    # DictRow; the column names are shared by every row of a query
+    __slots__ = ("_columns",)
+
+    def __init__(self, values, columns):
+        list.__init__(self, values)
+        self._columns = columns
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, slice)):
+            return list.__getitem__(self, key)
+        return list.__getitem__(self, self._columns[1][key])
+
+    def keys(self):
+        return list(self._columns[0])
+
+    def items(self):
+        return list(zip(self._columns[0], self))
+
+    def get(self, key, default=None):
+        return self[key] if key in self._columns[1] else default
+
+class Pending(Exception):
+    # raised by PrefetchedDatabase for a query it doesn't have the rows for yet
+    def __init__(self, sql, args):
+        Exception.__init__(self, sql)
+        self.sql = sql
+        self.args = args
+
+class PrefetchedDatabase(BaseDatabase):
+    # stands in for a database while the regular loaders run: queries it has
+    # rows for are answered straight away, anything else stops the loader with
+    # Pending.  whoever drives it fetches the rows (see run_batched and
+    # pypgdiff.aio) and runs the loader again, until it gets through
+    def __init__(self, db):
+        self.db = db
+        self.conn = db.conn
+        self.results = {}
+        self.rows = []
+        self.version = None
+
+    def key(self, sql, args):
+        return sql, repr(args)
+
+    def add(self, sql, args, rows):
+        self.results[self.key(sql, args)] = rows
+
+    def execute(self, sql, args=None):
+        try:
+            self.rows = self.results[self.key(sql, args)]
+        except KeyError:
+            raise Pending(sql, args)
+
+    def fetchall(self):
+        return self.rows
+
+    def stream(self, sql, args=None):
+        self.execute(sql, args)
+        for row in self.rows:
+            yield dict(row)
+
+    def mogrify(self, *args):
+        return self.db.mogrify(*args)
+
+    @property
+    def server_version(self):
+        return self.db.server_version if self.version is None else self.version
+
+    def get_types(self):
+        # shared with the real database, so nothing gets resolved twice
+        return self.db.get_types()
+
+def run_batched(db, *loaders):
+    # call each loader until it gets through against db (a PrefetchedDatabase),
+    # sending the queries they stopped on together with Database.batch: one
+    # round trip for every step the loaders have to take, rather than per query
+    while loaders:
+        waiting = []
+        for loader in loaders:
+            try:
+                loader()
+            except Pending as e:
+                waiting.append((loader, e))
+        if waiting:
+            queries = [(e.sql, e.args) for loader, e in waiting]
+            for (sql, args), rows in zip(queries, db.db.batch(queries)):
+                db.add(sql, args, rows)
+        loaders = [loader for loader, e in waiting]
+
+class SnapshotDatabase(BaseDatabase):
+    # stands in for a Database when a Schema is loaded from a snapshot
+    def __init__(self, server_version=None):
+        self._server_version = server_version
+
+    def execute(self, *args):
+        raise Exception("Can't run catalog queries against a snapshot")
+    fetchall=stream=batch=execute
+
+    def mogrify(self, sql, args):
+        from psycopg2.extensions import adapt
+        return sql % tuple(adapt(arg).getquoted() for arg in args)
+
+    @property
+    def server_version(self):
+        return self._server_version
+
 class Schema(BaseObject):
-    def __init__(self, database=None, name="public", cache=True, defaults={}):
+    # number of sequences read per round trip on servers without pg_sequences
+    sequence_batch_size = 500
+    # bump whenever the layout written by to_snapshot changes
+    snapshot_version = 1
+
+    def __init__(self, database=None, name="public", cache=True, defaults={}, cache_dir=None):
         from collections import defaultdict
         self.db = database
         self.name = name
         self.cache = cache
+        self.cache_dir = cache_dir
         self.defaults = defaultdict(dict, defaults)
 
     def __or__(self, other):
-        cs = Changeset()
-
-        # compare sequences
-        s1 = self.get_sequences()
-        s2 = other.get_sequences()
-        for name in set(s1.keys() + s2.keys()):
-            cs += s1.get(name, Sequence(self, None)) | s2.get(name, Sequence(other, None))
+        return list(self.iter_changes(other))
+
+    def iter_changes(self, other):
+        # yield the changes needed to get from other to self one phase at a
+        # time, in priority order, so callers can get going on the drops while
+        # later phases are still being compared.  only one phase is held in
+        # memory at a time; the phases that come back for the creates compare
+        # again rather than holding on to everything from the drops.
+
+        # load both sides up front, concurrently when they don't share a connection
+        shared = getattr(self.db, "conn", None) is getattr(other.db, "conn", None)
+        # the server side hashes are only worth their query when both sides
+        # can answer
+        f1 = f2 = None
+        if shared:
+            if self.summarizable() and other.summarizable():
+                f1, f2 = self.server_fingerprints(), other.server_fingerprints()
+        elif all(run_concurrently(self.summarizable, other.summarizable)):
+            f1, f2 = run_concurrently(self.server_fingerprints, other.server_fingerprints)
+        if f1 and f2 and all(f1[kind] == f2[kind] for kind in ("tables", "constraints", "indexes")):
+            # the servers agree there's nothing but sequences to compare, skip
+            # downloading the rest of the catalog
+            s1, s2 = self.get_sequences(), other.get_sequences()
+            t1 = t2 = c1 = c2 = i1 = i2 = {}
+        elif shared:
+            (s1, t1, c1, i1), (s2, t2, c2, i2) = self.introspect(), other.introspect()
+        else:
+            (s1, t1, c1, i1), (s2, t2, c2, i2) = run_concurrently(self.introspect, other.introspect)
+
+        # kinds of object that hash the same on both sides have nothing to compare.
+        # sequences always are, their hashes leave out last_value
+        same = {
+            "tables"     : hash_children(t1) == hash_children(t2),
+            "constraints": hash_children(c1) == hash_children(c2),
+            "indexes"    : hash_children(i1) == hash_children(i2),
+        }
 
-        # compare tables
-        t1 = self.get_tables()
-        t2 = other.get_tables()
-        for name in set(t1.keys() + t2.keys()):
-            cs += t1.get(name, Table(self, None)) | t2.get(name, Table(other, None))
+        phases = (
+            # drop indexes
+            (Index, i1, i2, set(i1.keys() + i2.keys()), 0, 10),
+            # drop constraints
+            (Constraint, c1, c2, set(c1.keys() + c2.keys()), 10, 20),
+            # drop tables, only the ones missing from self can be dropped
+            (Table, t1, t2, set(t2.keys()) - set(t1.keys()), 20, 30),
+            # drop, create and alter sequences
+            (Sequence, s1, s2, set(s1.keys() + s2.keys()), 30, 60),
+            # create and alter tables
+            (Table, t1, t2, set(t1.keys()), 60, 80),
+            # create constraints
+            (Constraint, c1, c2, set(c1.keys() + c2.keys()), 80, 90),
+            # create indexes
+            (Index, i1, i2, set(i1.keys() + i2.keys()), 90, 100),
+        )
+        # with the columnar backend, the tables on both sides are compared all
+        # at once and only the columns it finds changed get a closer look
+        columns = None
+        if Config().columnar and not same["tables"]:
+            from pypgdiff.columnar import ColumnStore
+            columns = ColumnStore(t1).diff(ColumnStore(t2))
+
+        for cls, d1, d2, names, low, high in phases:
+            if same.get(cls.kind):
+                continue
+            cs = Changeset()
+            # compare in name order, so the output is the same from run to run
+            for name in sorted(names):
+                if cls is Table and columns is not None and name in d1 and name in d2:
+                    if name in columns:
+                        cs += [c for c in d1[name].alter(d2[name], columns[name]) if low <= c.priority < high]
+                    continue
+                cs += [c for c in d1.get(name, cls(self, None)) | d2.get(name, cls(other, None)) if low <= c.priority < high]
+            for change in cs.ordered():
+                yield change
+
+    def fingerprints(self):
+        # a hash per kind of object, over the objects' fingerprints
+        sequences, tables, constraints, indexes = self.introspect()
+        return {
+            "sequences"  : hash_children(sequences),
+            "tables"     : hash_children(tables),
+            "constraints": hash_children(constraints),
+            "indexes"    : hash_children(indexes),
+        }
 
-        # compare constraints
-        c1 = self.get_constraints()
-        c2 = other.get_constraints()
-        for name in set(c1.keys() + c2.keys()):
-            cs += c1.get(name, Constraint(self, None)) | c2.get(name, Constraint(other, None))
+    @property
+    def fingerprint(self):
+        # equal for schemas with nothing to compare but sequence positions
+        return content_hash(self.fingerprints())
+
+    def summarizable(self):
+        # whether server_fingerprints() is worth asking for: there's a server
+        # to ask (not a snapshot, 10 or later), nothing is loaded yet and the
+        # disk cache, checked (and restored from) on the way, isn't current
+        if getattr(self.db, "conn", None) is None or self.db.server_version < 100000:
+            return False
+        if self.cache and hasattr(self, "_tables"):
+            return False
+        if self.cache and self.cache_dir:
+            hit, fingerprint, path = self.restore_from_disk()
+            if hit:
+                return False
+            # introspect() needn't ask again
+            self._disk_cache_miss = (fingerprint, path)
+        return True
 
-        # compare indexes
-        i1 = self.get_indexes()
-        i2 = other.get_indexes()
-        for name in set(i1.keys() + i2.keys()):
-            cs += i1.get(name, Index(self, None)) | i2.get(name, Index(other, None))
+    def server_fingerprints(self):
+        # the hash per kind of object from pypgdiff.summary, worked out by the
+        # server and downloaded as a single row
+        from pypgdiff.summary import ServerSummary
+        return ServerSummary(self.db, self.name).kind_hashes()
+
+    def introspect(self):
+        # load everything a comparison needs: sequences, tables and their
+        # columns (plus types for arrays), constraints and indexes
+        use_disk_cache = self.cache_dir and not (self.cache and hasattr(self, "_tables"))
+        if use_disk_cache:
+            if hasattr(self, "_disk_cache_miss"):
+                fingerprint, path = self._disk_cache_miss
+                del self._disk_cache_miss
+            else:
+                hit, fingerprint, path = self.restore_from_disk()
+                if hit:
+                    return self.get_sequences(), self._tables, self._constraints, self._indexes
+        if self.cache and getattr(self.db, "conn", None) is not None and \
+           not [x for x in ("_sequences", "_tables", "_constraints", "_indexes") if hasattr(self, x)]:
+            # nothing loaded yet, so everything can go out in a few batches
+            self.introspect_many([self])
+        sequences = self.get_sequences()
+        tables = self.get_tables()
+        if [t for t in tables.values() if not hasattr(t, "_cols")]:
+            self.load_columns(list(tables.values()))
+        constraints = self.get_constraints()
+        indexes = self.get_indexes()
+        if use_disk_cache and fingerprint:
+            write_snapshot(path, {
+                "fingerprint": fingerprint,
+                "snapshot"   : self._snapshot(sequences, tables, constraints, indexes),
+            })
+        return sequences, tables, constraints, indexes
+
+    def get_fingerprint(self):
+        # a cheap hash over the catalog rows behind this schema, along with
+        # the disk cache file for this database and schema
+        import hashlib, os
+        self.db.execute(
+            "SELECT " +
+                "current_database(), " +
+                "inet_server_addr()::text, " +
+                "inet_server_port(), " +
+                "md5(" +
+                    "COALESCE((SELECT string_agg(c.oid || ':' || c.xmin, ',' ORDER BY c.oid) " +
+                        "FROM pg_class c WHERE c.relnamespace = n.oid), '') || '|' || " +
+                    "COALESCE((SELECT string_agg(a.attrelid || '.' || a.attnum || ':' || a.xmin, ',' ORDER BY a.attrelid, a.attnum) " +
+                        "FROM pg_attribute a JOIN pg_class c ON (c.oid = a.attrelid) WHERE c.relnamespace = n.oid), '') || '|' || " +
+                    "COALESCE((SELECT string_agg(d.oid || ':' || d.xmin, ',' ORDER BY d.oid) " +
+                        "FROM pg_attrdef d JOIN pg_class c ON (c.oid = d.adrelid) WHERE c.relnamespace = n.oid), '') || '|' || " +
+                    "COALESCE((SELECT string_agg(i.indexrelid || ':' || i.xmin, ',' ORDER BY i.indexrelid) " +
+                        "FROM pg_index i JOIN pg_class c ON (c.oid = i.indrelid) WHERE c.relnamespace = n.oid), '') || '|' || " +
+                    "COALESCE((SELECT string_agg(con.oid || ':' || con.xmin, ',' ORDER BY con.oid) " +
+                        "FROM pg_constraint con WHERE con.connamespace = n.oid), '') || '|' || " +
+                    "COALESCE((SELECT string_agg(t.oid || ':' || t.xmin, ',' ORDER BY t.oid) " +
+                        "FROM pg_type t WHERE t.typnamespace = n.oid), '')" +
+                ") " +
+            "FROM pg_namespace n WHERE n.nspname = %s",
+            (self.name,)
+        )
+        rows = self.db.fetchall()
+        if not rows:
+            return None, None
+        database, addr, port, fingerprint = rows[0]
+        dsn = self.db.conn.get_dsn_parameters()
+        key = hashlib.sha1(("%s|%s|%s|%s|%s|%s" % (
+            dsn.get("host"), dsn.get("port"), addr, port, database, self.name
+        )).encode("utf-8")).hexdigest()
+        cache_dir = os.path.expanduser(self.cache_dir if self.cache_dir is not True else "~/.cache/pypgdiff")
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            # already there (possibly made by the other side's thread)
+            if not os.path.isdir(cache_dir):
+                raise
+        return fingerprint, os.path.join(cache_dir, "%s.json.gz" % key)
+
+    def restore_from_disk(self):
+        # restore from the disk cache when it's still current; whether it was,
+        # along with the fingerprint and file to write it back to
+        fingerprint, path = self.get_fingerprint()
+        if fingerprint and self.restore_cached(path, fingerprint):
+            # sequence state moves without touching the catalog, always read it live
+            del self._sequences
+            return True, fingerprint, path
+        return False, fingerprint, path
+
+    def restore_cached(self, path, fingerprint):
+        import os
+        if not os.path.exists(path):
+            return False
+        try:
+            cached = read_snapshot(path)
+        except (IOError, ValueError):
+            # unreadable cache files are just a cache miss
+            return False
+        if cached.get("fingerprint") != fingerprint or cached["snapshot"].get("version") != self.snapshot_version:
+            return False
+        self.restore(cached["snapshot"])
+        return True
 
-        return sorted(cs)
+    def to_snapshot(self):
+        return self._snapshot(*self.introspect())
+
+    def _snapshot(self, sequences, tables, constraints, indexes):
+        # everything introspect() loads, as plain JSON-friendly data
+        # NOTE: lists are sorted so equal schemas make identical snapshots
+        snapshot = {
+            "version"       : self.snapshot_version,
+            "name"          : self.name,
+            "server_version": self.db.server_version,
+            "sequences"     : [sequences[name].props.copy() for name in sorted(sequences)],
+            "tables"        : dict((name, [col.props.copy() for col in table.get_columns().values()]) for name, table in tables.items()),
+            "constraints"   : [],
+            "indexes"       : [],
+            "array_info"    : sorted([table_name, column_name, info] for (table_name, column_name), info in getattr(self, "_array_info", {}).items()),
+            "types"         : [],
+        }
+        for key in sorted(constraints):
+            props = dict(constraints[key].props)
+            # comparison keys depend on the config at load time
+            del props["comparison_key"]
+            if "columns" in props:
+                props["columns"] = sorted(props["columns"])
+            snapshot["constraints"].append(props)
+        for name in sorted(indexes):
+            props = dict(indexes[name].props)
+            del props["comparison_indexdef"]
+            snapshot["indexes"].append(props)
+        types = dict((info["oid"], info) for info in self.get_types().values())
+        for oid in sorted(types):
+            snapshot["types"].append(dict((k, types[oid][k]) for k in ("oid", "typname", "typelem", "sql_type")))
+        if getattr(self, "_markers", None) is not None:
+            # what the catalog looked like, for incremental()
+            snapshot["markers"] = self._markers
+        return snapshot
+
+    @classmethod
+    def from_snapshot(cls, snapshot, defaults={}):
+        self = cls(database=SnapshotDatabase(snapshot.get("server_version")), name=snapshot.get("name"), cache=True, defaults=defaults)
+        self.restore(snapshot)
+        return self
+
+    def restore(self, snapshot):
+        from collections import OrderedDict
+        if snapshot.get("version") != self.snapshot_version:
+            raise Exception("Unsupported snapshot version: %s" % snapshot.get("version"))
+        self._sequences = dict()
+        for props in snapshot["sequences"]:
+            self._sequences[props["sequence_name"]] = Sequence(self, props["sequence_name"], **props)
+        self._tables = dict()
+        for name, columns in snapshot["tables"].items():
+            table = self._tables[name] = Table(self, name)
+            table._cols = OrderedDict()
+            for props in columns:
+                table._cols[props["column_name"]] = Column(table, props["column_name"], **props)
+        self._constraints = dict()
+        for props in snapshot["constraints"]:
+            if "columns" in props:
+                props["columns"] = set(props["columns"])
+            props = self.normalize_constraint(props)
+            self._constraints[props["comparison_key"]] = Constraint(self, props["constraint_name"], **props)
+        self._indexes = dict()
+        for props in snapshot["indexes"]:
+            self._indexes[props["indexname"]] = Index(self, props["indexname"], **props)
+        self._array_info = dict()
+        for table_name, column_name, info in snapshot["array_info"]:
+            self._array_info[(table_name, column_name)] = info
+        types = self.get_types()
+        for info in snapshot["types"]:
+            types[info["typname"]] = types[info["oid"]] = info
+        if "markers" in snapshot:
+            self._markers = snapshot["markers"]
+        return self
+
+    def save(self, path):
+        write_snapshot(path, self.to_snapshot())
+
+    @classmethod
+    def incremental(cls, database, name="public", snapshot=None, defaults={}):
+        # a schema brought up to date from a snapshot of a schema made by this
+        # method, only reading back the tables and sequences whose catalog
+        # rows changed since.  with no snapshot (or one without markers)
+        # everything is introspected, and markers are kept for the next run
+        if snapshot is None or snapshot.get("markers") is None:
+            self = cls(database=database, name=name, cache=True, defaults=defaults)
+            # markers first, anything changing in between is picked up next time
+            self._markers = self.get_markers()
+            self.introspect()
+            return self
+        self = cls(database=database, name=snapshot["name"], cache=True, defaults=defaults)
+        self.restore(snapshot)
+        return self.refresh()
+
+    def get_markers(self):
+        # a hash per table and sequence over its catalog rows (and a
+        # sequence's position), all in one query
+        self.db.execute(
+            "SELECT " +
+                "c.relname, " +
+                "c.relkind, " +
+                "md5(" +
+                    "c.xmin::text || '|' || " +
+                    "COALESCE((SELECT string_agg(a.attnum || ':' || a.xmin, ',' ORDER BY a.attnum) " +
+                        "FROM pg_attribute a WHERE a.attrelid = c.oid), '') || '|' || " +
+                    "COALESCE((SELECT string_agg(d.oid || ':' || d.xmin, ',' ORDER BY d.oid) " +
+                        "FROM pg_attrdef d WHERE d.adrelid = c.oid), '') || '|' || " +
+                    "COALESCE((SELECT string_agg(i.indexrelid || ':' || i.xmin || ':' || ic.xmin, ',' ORDER BY i.indexrelid) " +
+                        "FROM pg_index i JOIN pg_class ic ON (ic.oid = i.indexrelid) WHERE i.indrelid = c.oid), '') || '|' || " +
+                    "COALESCE((SELECT string_agg(con.oid || ':' || con.xmin, ',' ORDER BY con.oid) " +
+                        "FROM pg_constraint con WHERE con.conrelid = c.oid), '')" +
+                    (
+                        # sequence options and position live outside pg_class since 10
+                        " || '|' || COALESCE((SELECT s.xmin::text FROM pg_sequence s WHERE s.seqrelid = c.oid), '') || " +
+                        "CASE WHEN c.relkind = 'S' AND has_sequence_privilege(c.oid, 'SELECT,USAGE') " +
+                            "THEN COALESCE(pg_sequence_last_value(c.oid)::text, '') ELSE '' END"
+                        if self.db.server_version >= 100000 else ""
+                    ) +
+                ") " +
+            "FROM pg_class c JOIN pg_namespace n ON (n.oid = c.relnamespace) " +
+            "WHERE n.nspname = %s AND c.relkind IN ('r', 'p', 'S') AND c.relname !~ '^pgsql_'",
+            (self.name,)
+        )
+        return dict((name, [kind, marker]) for name, kind, marker in self.db.fetchall())
+
+    def refresh(self):
+        # re-read whatever changed since the markers were taken, at the cost
+        # of one query when nothing did
+        old = self._markers
+        markers = self._markers = self.get_markers()
+        changed = set(name for name in set(markers) | set(old) if markers.get(name) != old.get(name))
+        if self.db.server_version < 100000:
+            # before 10, a sequence's options and position live in the sequence
+            # itself and its markers can't tell, so sequences are always re-read
+            changed |= set(name for name in set(markers) | set(old) if (markers.get(name) or old.get(name))[0] == "S")
+        if not changed:
+            return self
+        sequences = set(name for name in changed if (markers.get(name) or old.get(name))[0] == "S")
+        tables = changed - sequences
+        # foreign keys name the columns they point at, so tables referencing a
+        # changed table are read again too
+        for constraint in self._constraints.values():
+            if constraint.props["constraint_type"] in ("FOREIGN KEY",) and constraint.props["to"][0]["table_name"] in tables:
+                tables.add(constraint.props["table_name"])
+
+        if tables:
+            self._constraints = dict((k, c) for k, c in self._constraints.items() if c.props["table_name"] not in tables)
+            self._indexes = dict((k, i) for k, i in self._indexes.items() if i.props["tablename"] not in tables)
+            if hasattr(self, "_array_info"):
+                self._array_info = dict((k, v) for k, v in self._array_info.items() if k[0] not in tables)
+            for name in tables:
+                self._tables.pop(name, None)
+            existing = sorted(name for name in tables if name in markers)
+            for name in existing:
+                self._tables[name] = Table(self, name)
+            if existing:
+                self.load_columns([self._tables[name] for name in existing])
+                self.load_constraints([self], tables=existing)
+                self.load_indexes([self], tables=existing)
+
+        if sequences:
+            for name in sequences:
+                self._sequences.pop(name, None)
+            existing = sorted(name for name in sequences if name in markers)
+            if existing:
+                self.load_sequences([self], names=existing)
+        return self
+
+    @classmethod
+    def load(cls, path, defaults={}):
+        return cls.from_snapshot(read_snapshot(path), defaults=defaults)
 
     def get_default(self, column):
         import datetime
@@ -105,34 +923,179 @@ class Schema(BaseObject):
                 return Undefined
         return Undefined
 
+    @classmethod
+    def introspect_many(cls, schemas):
+        # introspect several schemas that share a database, with one query per
+        # kind of object for all of them: sequences, tables, constraints and
+        # indexes batched together, then the columns streamed (there can be
+        # far too many of them to come back as a single json value), then
+        # array types
+        if not schemas:
+            return schemas
+        db = schemas[0].db
+        prefetched = PrefetchedDatabase(db)
+        for schema in schemas:
+            schema.db = prefetched
+        try:
+            run_batched(
+                prefetched,
+                lambda: cls.load_sequences(schemas),
+                lambda: cls.load_tables(schemas),
+                lambda: cls.load_constraints(schemas),
+                lambda: cls.load_indexes(schemas),
+            )
+        finally:
+            for schema in schemas:
+                schema.db = db
+        cls.load_columns([t for schema in schemas for t in schema._tables.values()])
+        return schemas
+
     def get_tables(self):
         if self.cache:
             try:
                 return self._tables
             except AttributeError:
                 pass
-        self._tables = dict()
-        self.db.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = %s AND table_type = 'BASE TABLE' AND table_name !~ '^pgsql_'", (self.name,))
-        for table_name in [x[0] for x in self.db.fetchall()]:
-            self._tables[table_name] = Table(self, table_name)
+        self.load_tables([self])
         return self._tables
 
+    @classmethod
+    def load_tables(cls, schemas):
+        if not schemas:
+            return
+        db = schemas[0].db
+        by_name = dict((schema.name, schema) for schema in schemas)
+        for schema in schemas:
+            schema._tables = dict()
+        db.execute("SELECT table_schema, table_name FROM information_schema.tables WHERE table_schema = ANY(%s) AND table_type = 'BASE TABLE' AND table_name !~ '^pgsql_'", (list(by_name.keys()),))
+        for schema_name, table_name in db.fetchall():
+            schema = by_name[schema_name]
+            schema._tables[table_name] = Table(schema, table_name)
+
+    @classmethod
+    def load_columns(cls, tables):
+        # fetch the columns of all the given tables (of schemas sharing a
+        # database) in one query instead of one per table
+        from collections import OrderedDict
+        if not tables:
+            return tables
+        db = tables[0].schema.db
+        by_name = dict()
+        for table in tables:
+            table._cols = OrderedDict()
+            by_name[(table.schema.name, table.name)] = table
+        array_types = set()
+        # the biggest catalog query by far, streamed rather than fetched all at once
+        rows = db.stream("SELECT * FROM information_schema.columns WHERE table_schema = ANY(%s) AND table_name = ANY(%s) ORDER BY table_schema, table_name, ordinal_position ASC",
+                         (list(set([table.schema.name for table in tables])), list(set([table.name for table in tables]))))
+        for m in rows:
+            table = by_name.get((m["table_schema"], m["table_name"]))
+            if table is None:
+                continue
+            if m["data_type"] == "ARRAY":
+                array_types.add((m["udt_schema"], m["udt_name"]))
+            table.scrub_schema_info(m)
+            table._cols[m["column_name"]] = Column(table, m["column_name"], **m)
+        if array_types:
+            # rendering array columns needs element types and precision, fetch
+            # them now rather than from inside SQL generation
+            db.resolve_types(
+                names=[udt_name for udt_schema, udt_name in array_types],
+                namespaces=list(set([udt_schema for udt_schema, udt_name in array_types]))
+            )
+            cls.load_array_info(list(set([table.schema for table in tables])))
+        return tables
+
     def get_sequences(self):
         if self.cache:
             try:
                 return self._sequences
             except AttributeError:
                 pass
-        self._sequences = dict()
-
-        # not all sequence information is available in the information_schema
-        self.db.execute("SELECT sequence_name FROM information_schema.sequences WHERE sequence_schema = %s", (self.name,))
-        for sequence_name in [x[0] for x in self.db.fetchall()]:
-            self.db.execute("SELECT * FROM %s.%s" % (self.name, sequence_name))
-            props = dict(filter(lambda x: x[0] not in ("sequence_catalog", "sequence_schema", "is_called", "log_cnt"), dict(self.db.fetchall()[0]).items()))
-            self._sequences[sequence_name] = Sequence(self, sequence_name, **props)
+        self.load_sequences([self])
         return self._sequences
 
+    @classmethod
+    def load_sequences(cls, schemas, names=None):
+        # with names, only those sequences are (re)loaded and the rest are kept
+        if not schemas:
+            return
+        db = schemas[0].db
+        by_name = dict((schema.name, schema) for schema in schemas)
+        for schema in schemas:
+            if names is None:
+                schema._sequences = dict()
+
+        if db.server_version >= 100000:
+            # everything we need lives in pg_sequences; a sequence that has
+            # never been called has no last_value, which used to read as its start
+            db.execute(
+                "SELECT " +
+                    "schemaname AS sequence_schema, " +
+                    "sequencename AS sequence_name, " +
+                    "COALESCE(last_value, start_value) AS last_value, " +
+                    "start_value, " +
+                    "increment_by, " +
+                    "max_value, " +
+                    "min_value, " +
+                    "cache_size AS cache_value, " +
+                    "cycle AS is_cycled " +
+                "FROM pg_sequences WHERE schemaname = ANY(%s)" +
+                (" AND sequencename = ANY(%s)" if names is not None else ""),
+                (list(by_name.keys()),) + ((list(names),) if names is not None else ())
+            )
+            rows = db.fetchall()
+        else:
+            # older servers only expose sequence state on the sequence itself,
+            # so read it back with one UNION ALL per batch of sequences
+            db.execute("SELECT sequence_schema, sequence_name FROM information_schema.sequences WHERE sequence_schema = ANY(%s)" +
+                       (" AND sequence_name = ANY(%s)" if names is not None else ""),
+                       (list(by_name.keys()),) + ((list(names),) if names is not None else ()))
+            found = [(x[0], x[1]) for x in db.fetchall()]
+            rows = []
+            for i in range(0, len(found), cls.sequence_batch_size):
+                batch = found[i:i + cls.sequence_batch_size]
+                db.execute(" UNION ALL ".join([
+                    "SELECT " +
+                        "%s AS sequence_schema, " +
+                        "%s AS sequence_name, " +
+                        "last_value, " +
+                        "start_value, " +
+                        "increment_by, " +
+                        "max_value, " +
+                        "min_value, " +
+                        "cache_value, " +
+                        "is_cycled " +
+                    "FROM %s.%s" % (db.quote_ident(sequence_schema), db.quote_ident(sequence_name))
+                    for sequence_schema, sequence_name in batch
+                ]), [x for pair in batch for x in pair])
+                rows += db.fetchall()
+        for props in map(dict, rows):
+            schema = by_name[props.pop("sequence_schema")]
+            schema._sequences[props["sequence_name"]] = Sequence(schema, props["sequence_name"], **props)
+
+    def normalize_constraint(self, props):
+        # possibly normalize constraints
+        conf = Config()
+        # default comparison key
+        props["comparison_key"] = props["constraint_name"]
+        # use a different comparison key based on the constraint
+        if conf.normalize_constraints:
+            if props["constraint_type"] in ("PRIMARY KEY","UNIQUE"):
+                props["comparison_key"] = "%s_%s_%s" % (props["constraint_type"],
+                                                        props["table_name"],
+                                                        "_".join(sorted(props["columns"])))
+            elif props["constraint_type"] in ("FOREIGN KEY",):
+                props["comparison_key"] = "%s_%s_%s__to__%s" % (props["constraint_type"],
+                                                                props["table_name"],
+                                                                "_".join(sorted(map(lambda x: x["column_name"], props["from"]))),
+                                                                "_".join(sorted(map(lambda x: x["column_name"], props["to"]))))
+            elif props["constraint_type"] in ("CHECK",):
+                props["comparison_key"] = "CHECK_%s_%s" % (props["table_name"], props["clause"])
+            else:
+                raise Exception("Unknown normalization type: %s" % props["constraint_type"])
+        return props
+
     def get_constraints(self):
         # TODO: are constraint names unique per schema?
         if self.cache:
@@ -140,73 +1103,94 @@ class Schema(BaseObject):
                 return self._constraints
             except AttributeError:
                 pass
-        self._constraints = dict()
-
-        # possibly normalize constraints
-        def normalize_props(props):
-            conf = Config()
-            # default comparison key
-            props["comparison_key"] = props["constraint_name"]
-            # use a different comparison key based on the constraint
-            if conf.normalize_constraints:
-                if props["constraint_type"] in ("PRIMARY KEY","UNIQUE"):
-                    props["comparison_key"] = "%s_%s_%s" % (props["constraint_type"],
-                                                            props["table_name"],
-                                                            "_".join(sorted(props["columns"])))
-                elif props["constraint_type"] in ("FOREIGN KEY",):
-                    props["comparison_key"] = "%s_%s_%s__to__%s" % (props["constraint_type"],
-                                                                    props["table_name"],
-                                                                    "_".join(sorted(map(lambda x: x["column_name"], props["from"]))),
-                                                                    "_".join(sorted(map(lambda x: x["column_name"], props["to"]))))
-                elif props["constraint_type"] in ("CHECK",):
-                    props["comparison_key"] = "CHECK_%s_%s" % (props["table_name"], props["clause"])
-                else:
-                    raise Exception("Unknown normalization type: %s" % props["constraint_type"])
-            return props
-
-        # PRIMARY KEY / UNIQUE
-        self.db.execute("SELECT * FROM information_schema.table_constraints WHERE constraint_schema = %s AND constraint_type IN ('PRIMARY KEY', 'UNIQUE')", (self.name,))
-        for props in map(dict, [x for x in self.db.fetchall()]):
-            self.scrub_schema_info(props)
-            self.db.execute("SELECT column_name FROM information_schema.constraint_column_usage WHERE " +
-                                "constraint_schema = %s AND table_schema = %s AND table_name = %s AND constraint_name = %s",
-                                (self.name, self.name, props["table_name"], props["constraint_name"]))
-            props["columns"] = set([x[0] for x in self.db.fetchall()])
-            props = normalize_props(props)
-            self._constraints[props["comparison_key"]] = Constraint(self, props["constraint_name"], **props)
-
-        # FOREIGN KEY
-        self.db.execute("SELECT * FROM information_schema.table_constraints WHERE constraint_schema = %s AND constraint_type IN ('FOREIGN KEY')", (self.name,))
-        for props in map(dict, [x for x in self.db.fetchall()]):
-            self.scrub_schema_info(props)
-            self.db.execute("SELECT * FROM information_schema.constraint_column_usage WHERE " +
-                                "constraint_schema = %s AND constraint_name = %s",
-                                (self.name, props["constraint_name"]))
-            props["to"] = map(self.scrub_schema_info, map(dict, [x for x in self.db.fetchall()]))
-
-            self.db.execute("SELECT * FROM information_schema.key_column_usage WHERE " +
-                                "constraint_schema = %s AND constraint_name = %s",
-                                (self.name, props["constraint_name"]))
-            props["from"] = map(self.scrub_schema_info, map(dict, [x for x in self.db.fetchall()]))
-
-            props = normalize_props(props)
-            self._constraints[props["comparison_key"]] = Constraint(self, props["constraint_name"], **props)
+        self.load_constraints([self])
+        return self._constraints
 
-        # CHECK
+    @classmethod
+    def load_constraints(cls, schemas, tables=None):
+        # with tables, only the constraints on those tables are (re)loaded
+        if not schemas:
+            return
+        db = schemas[0].db
+        by_name = dict((schema.name, schema) for schema in schemas)
+        for schema in schemas:
+            if tables is None:
+                schema._constraints = dict()
+
+        # PRIMARY KEY / UNIQUE / FOREIGN KEY / CHECK, all straight from the catalog
         # NOTE: NOT NULL constraints will be implicit
-        self.db.execute("SELECT * FROM information_schema.table_constraints WHERE constraint_schema = %s AND constraint_type IN ('CHECK') AND constraint_name !~ '_not_null$'", (self.name,))
-        for props in map(dict, [x for x in self.db.fetchall()]):
-            self.scrub_schema_info(props)
-            self.db.execute("SELECT check_clause FROM information_schema.check_constraints WHERE " +
-                                "constraint_schema = %s AND constraint_name = %s",
-                                (self.name, props["constraint_name"]))
-            # only one expression per constraint
-            props["clause"] = self.db.fetchall()[0][0]
-
-            props = normalize_props(props)
-            self._constraints[props["comparison_key"]] = Constraint(self, props["constraint_name"], **props)
-
-        return self._constraints
+        rows = db.stream(
+            "SELECT " +
+                "n.nspname AS constraint_schema, " +
+                "con.conname AS constraint_name, " +
+                "con.contype, " +
+                "rel.relname AS table_name, " +
+                "frel.relname AS foreign_table_name, " +
+                "con.condeferrable, " +
+                "con.condeferred, " +
+                "ARRAY(SELECT a.attname::text FROM unnest(con.conkey) WITH ORDINALITY AS k(attnum, n) " +
+                    "JOIN pg_attribute a ON (a.attrelid = con.conrelid AND a.attnum = k.attnum) ORDER BY k.n) AS from_columns, " +
+                "ARRAY(SELECT a.attname::text FROM unnest(con.confkey) WITH ORDINALITY AS k(attnum, n) " +
+                    "JOIN pg_attribute a ON (a.attrelid = con.confrelid AND a.attnum = k.attnum) ORDER BY k.n) AS to_columns, " +
+                # where each referenced column sits in the key it references, like
+                # information_schema's position_in_unique_constraint
+                "ARRAY(SELECT (SELECT i.n FROM pg_index ix, unnest(ix.indkey::int2[]) WITH ORDINALITY AS i(attnum, n) " +
+                        "WHERE ix.indexrelid = con.conindid AND i.attnum = k.attnum) " +
+                    "FROM unnest(con.confkey) WITH ORDINALITY AS k(attnum, n) ORDER BY k.n) AS to_positions, " +
+                "pg_get_constraintdef(con.oid) AS definition " +
+            "FROM " +
+                "pg_constraint con " +
+                    "JOIN pg_namespace n ON (n.oid = con.connamespace) " +
+                    "JOIN pg_class rel ON (rel.oid = con.conrelid) " +
+                    "LEFT JOIN pg_class frel ON (frel.oid = con.confrelid) " +
+            "WHERE " +
+                "n.nspname = ANY(%s) AND " +
+                "con.contype IN ('p', 'u', 'f', 'c') AND " +
+                "NOT (con.contype = 'c' AND con.conname ~ '_not_null$') " +
+                ("AND rel.relname = ANY(%s) " if tables is not None else "") +
+            "ORDER BY con.conname",
+            (list(by_name.keys()),) + ((list(tables),) if tables is not None else ())
+        )
+        constraint_types = {
+            "p": "PRIMARY KEY",
+            "u": "UNIQUE",
+            "f": "FOREIGN KEY",
+            "c": "CHECK",
+        }
+        for row in rows:
+            schema = by_name[row["constraint_schema"]]
+            # mirror the information_schema layout the rest of pypgdiff expects
+            props = {
+                "constraint_name"   : row["constraint_name"],
+                "table_name"        : row["table_name"],
+                "constraint_type"   : constraint_types[row["contype"]],
+                "is_deferrable"     : "YES" if row["condeferrable"] else "NO",
+                "initially_deferred": "YES" if row["condeferred"] else "NO",
+            }
+            if props["constraint_type"] in ("PRIMARY KEY", "UNIQUE"):
+                props["columns"] = set(row["from_columns"])
+            elif props["constraint_type"] in ("FOREIGN KEY",):
+                props["to"] = [{
+                    "constraint_name": row["constraint_name"],
+                    "table_name"     : row["foreign_table_name"],
+                    "column_name"    : column_name,
+                } for column_name in row["to_columns"]]
+                props["from"] = [{
+                    "constraint_name"              : row["constraint_name"],
+                    "table_name"                   : row["table_name"],
+                    "column_name"                  : column_name,
+                    "position_in_unique_constraint": position,
+                } for column_name, position in zip(row["from_columns"], row["to_positions"])]
+            elif props["constraint_type"] in ("CHECK",):
+                # only one expression per constraint, minus the leading "CHECK "
+                props["clause"] = row["definition"][len("CHECK "):]
+
+            props = schema.normalize_constraint(props)
+            # normalized keys can collide, the last by name wins whatever order
+            # the rows come in (batched, they needn't be sorted)
+            other = schema._constraints.get(props["comparison_key"])
+            if other is None or other.name < props["constraint_name"]:
+                schema._constraints[props["comparison_key"]] = Constraint(schema, props["constraint_name"], **props)
 
     def get_indexes(self):
         if self.cache:
@@ -214,67 +1198,117 @@ class Schema(BaseObject):
                 return self._indexes
             except AttributeError:
                 pass
-        self._indexes = dict()
-        # TODO: gotta be a less grody way to do this
-        self.db.execute("SELECT * FROM pg_indexes WHERE schemaname = %s AND indexname !~ '(_pkey|_key)$' AND indexdef !~ '^CREATE UNIQUE'", (self.name,))
-        for props in map(dict, [x for x in self.db.fetchall()]):
-            self.scrub_schema_info(props)
-            self._indexes[props["indexname"]] = Index(self, props["indexname"], **props)
+        self.load_indexes([self])
         return self._indexes
 
+    @classmethod
+    def load_indexes(cls, schemas, tables=None):
+        # with tables, only the indexes on those tables are (re)loaded
+        if not schemas:
+            return
+        db = schemas[0].db
+        by_name = dict((schema.name, schema) for schema in schemas)
+        for schema in schemas:
+            if tables is None:
+                schema._indexes = dict()
+        # TODO: gotta be a less grody way to do this
+        rows = db.stream("SELECT * FROM pg_indexes WHERE schemaname = ANY(%s) AND indexname !~ '(_pkey|_key)$' AND indexdef !~ '^CREATE UNIQUE'" +
+                         (" AND tablename = ANY(%s)" if tables is not None else ""),
+                         (list(by_name.keys()),) + ((list(tables),) if tables is not None else ()))
+        for props in rows:
+            schema = by_name[props["schemaname"]]
+            schema.scrub_schema_info(props)
+            schema._indexes[props["indexname"]] = Index(schema, props["indexname"], **props)
+
     def get_types(self):
-        try:
-            return self._type_info
-        except AttributeError:
-            pass
-        self._type_info = dict()
-        # TODO: need a proper way to convert type names to SQL types
-        sql_types = {
-            "int2"  : "smallint",
-            "int4"  : "integer",
-            "int8"  : "bigint",
-            "bpchar": "character",
-        }
-        self.db.execute("SELECT pg_type.*, pg_type.oid FROM pg_type WHERE typname !~ '^pg_'")
-        for info in map(dict, [x for x in self.db.fetchall()]):
-            info["sql_type"] = sql_types.get(
-                info["typname"].replace("_", ""),
-                info["typname"]
-            )
-            self._type_info[info["typname"]] = self._type_info[info["oid"]] = info
-        return self._type_info
+        return self.db.get_types()
+
+    def resolve_types(self, *args, **kwargs):
+        return self.db.resolve_types(*args, **kwargs)
 
     def type_info(self, udt_name):
-        return self.get_types().get(udt_name)
+        return self.db.type_info(udt_name)
 
-    def expand_array(self, table_name, column_name):
-        self.db.execute(
+
+    def get_array_info(self):
+        try:
+            return self._array_info
+        except AttributeError:
+            pass
+        self.load_array_info([self])
+        return self._array_info
+
+    @classmethod
+    def load_array_info(cls, schemas):
+        # type precision isn't available for arrays in the information_schema view,
+        # so collect it for every array column in the schemas up front
+        if not schemas:
+            return
+        db = schemas[0].db
+        by_name = dict((schema.name, schema) for schema in schemas)
+        for schema in schemas:
+            schema._array_info = dict()
+        db.execute(
             "SELECT " +
+                "n.nspname AS table_schema, " +
+                "c.relname AS table_name, " +
+                "a.attname AS column_name, " +
                 "(information_schema._pg_char_max_length(t.typelem, a.atttypmod))::information_schema.cardinal_number AS character_maximum_length, " +
                 "(information_schema._pg_numeric_precision(t.typelem, a.atttypmod))::information_schema.cardinal_number AS numeric_precision, " +
                 "(information_schema._pg_numeric_scale(t.typelem, a.atttypmod))::information_schema.cardinal_number AS numeric_scale " +
             "FROM " +
                 "pg_attribute a " +
-                    "LEFT JOIN pg_attrdef ad ON ((a.attrelid = ad.adrelid) AND (a.attnum = ad.adnum)) " +
-                    "LEFT JOIN pg_type t ON (a.atttypid = t.oid), " +
-                "pg_class c " +
+                    "JOIN pg_class c ON (a.attrelid = c.oid) " +
+                    "JOIN pg_namespace n ON (c.relnamespace = n.oid) " +
+                    "JOIN pg_type t ON (a.atttypid = t.oid) " +
             "WHERE " +
-                "a.attrelid = c.oid AND " +
-                "c.relname = %s AND " +
-                "a.attname = %s",
-            (table_name, column_name)
+                "n.nspname = ANY(%s) AND " +
+                "t.typcategory = 'A' AND " +
+                "a.attnum > 0 AND " +
+                "NOT a.attisdropped",
+            (list(by_name.keys()),)
+        )
+        for info in map(dict, db.fetchall()):
+            schema = by_name[info.pop("table_schema")]
+            schema._array_info[(info.pop("table_name"), info.pop("column_name"))] = info
+
+    def expand_array(self, table_name, column_name):
+        return dict(self.get_array_info().get((table_name, column_name), {}))
+
+def diff_schemas(source, target, pairs, **kwargs):
+    # compare many (source name, target name) schema pairs, sharing one
+    # connection and one type catalog per side, and introspecting every
+    # schema on a side with the same bulk queries
+    kwargs["cache"] = True
+    sources = dict((a, Schema(database=source, name=a, **kwargs)) for a, b in pairs)
+    if source.conn is target.conn:
+        # both sides live in one database, load everything in one go
+        targets = sources
+        for a, b in pairs:
+            if b not in targets:
+                targets[b] = Schema(database=source, name=b, **kwargs)
+        Schema.introspect_many(list(targets.values()))
+    else:
+        targets = dict((b, Schema(database=target, name=b, **kwargs)) for a, b in pairs)
+        run_concurrently(
+            lambda: Schema.introspect_many(list(sources.values())),
+            lambda: Schema.introspect_many(list(targets.values()))
         )
-        return dict(self.db.fetchall()[0])
+    for a, b in pairs:
+        yield a, b, sources[a] | targets[b]
 
 ################################################################################
 ## TABLES
 ################################################################################
 
 class Column(BaseObject):
+    # there can be hundreds of thousands of these, keep them small
+    __slots__ = ("table", "name", "props", "_fingerprint")
+
     def __init__(self, table, name, **props):
         self.table = table
         self.name = name
-        self.props = props
+        self.props = Props(props)
 
     @property
     def safe_name(self):
@@ -290,10 +1324,10 @@ class Column(BaseObject):
             return repr(val)
         else:
             # lol
-            return self.table.schema.db.curs.mogrify("%s", (val,))
+            return self.table.schema.db.mogrify("%s", (val,))
 
     def __eq__(self, other):
-        return self.comparison_props == other.comparison_props
+        return self.fingerprint == other.fingerprint or self.comparison_props == other.comparison_props
 
     def __or__(self, other):
         cs = Changeset()
@@ -319,13 +1353,24 @@ class Column(BaseObject):
     def expand_array(self):
         props = self.table.schema.expand_array(self.table.name, self.name)
         self.props.update(props)
+        self.invalidate_fingerprint()
 
 class Table(BaseObject):
+    kind = "tables"
+
     def __init__(self, schema, name):
         self.schema = schema
         self.name = name
 
+    @property
+    def fingerprint(self):
+        # over the columns' fingerprints, which are cached; this isn't, so it
+        # never goes stale
+        return hash_children(self.get_columns())
+
     def __eq__(self, other):
+        if self.fingerprint == other.fingerprint:
+            return True
         c1 = self.get_columns()
         c2 = other.get_columns()
         for col in set(c1.keys() + c2.keys()):
@@ -349,27 +1394,30 @@ class Table(BaseObject):
             pass
         else:
             # both tables exist, get our compare on
-            from pypgdiff.changes import AlterTable
-            c1 = self.get_columns()
-            c2 = other.get_columns()
-            _cs = Changeset()
-            for name in set(c1.keys() + c2.keys()):
-                _cs += c1.get(name, Column(self, None)) | c2.get(name, Column(other, None))
-            cs += AlterTable(self, other, changeset=_cs)
+            cs += self.alter(other)
 
         return cs
 
+    def alter(self, other, names=None):
+        # AlterTable over the given columns, by default all of them
+        from pypgdiff.changes import AlterTable
+        c1 = self.get_columns()
+        c2 = other.get_columns()
+        _cs = Changeset()
+        for name in set(c1.keys() + c2.keys()) if names is None else set(names):
+            _cs += c1.get(name, Column(self, None)) | c2.get(name, Column(other, None))
+        return Changeset(AlterTable(self, other, changeset=_cs))
+
     def get_columns(self):
-        from collections import OrderedDict
         try:
             return self._cols
         except AttributeError:
             pass
-        self.schema.db.execute("SELECT * FROM information_schema.columns WHERE table_schema = %s AND table_name = %s ORDER BY ordinal_position ASC", (self.schema.name, self.name))
-        self._cols = OrderedDict()
-        for m in map(dict, self.schema.db.fetchall()):
-            self.scrub_schema_info(m)
-            self._cols[m["column_name"]] = Column(self, m["column_name"], **m)
+        # load every table in the schema at once, unless this table isn't one of them
+        tables = getattr(self.schema, "_tables", {})
+        if tables.get(self.name) is not self:
+            tables = {self.name: self}
+        self.schema.load_columns(list(tables.values()))
         return self._cols
 
 ################################################################################
@@ -377,13 +1425,16 @@ class Table(BaseObject):
 ################################################################################
 
 class Sequence(BaseObject):
+    kind = "sequences"
+    __slots__ = ("schema", "name", "props", "_fingerprint")
+
     def __init__(self, schema, name, **props):
         self.schema = schema
         self.name = name
-        self.props = props
+        self.props = Props(props)
 
     def __eq__(self, other):
-        if self.comparison_props != other.comparison_props:
+        if self.fingerprint != other.fingerprint and self.comparison_props != other.comparison_props:
             return False
         # everything but last_value matches!
         if self.props["last_value"] > other.props["last_value"]:
@@ -425,13 +1476,17 @@ class Sequence(BaseObject):
 ################################################################################
 
 class Constraint(BaseObject):
+    kind = "constraints"
+    # props stay a dict, they nest lists of dicts
+    __slots__ = ("schema", "name", "props", "_fingerprint")
+
     def __init__(self, schema, name, **props):
         self.schema = schema
         self.name = name
         self.props = props
 
     def __eq__(self, other):
-        return self.comparison_props == other.comparison_props
+        return self.fingerprint == other.fingerprint or self.comparison_props == other.comparison_props
 
     def __or__(self, other):
         cs = Changeset()
@@ -473,16 +1528,25 @@ class Constraint(BaseObject):
 ################################################################################
 
 class Index(BaseObject):
+    kind = "indexes"
+
+    __slots__ = ("schema", "name", "props", "_fingerprint")
+
     def __init__(self, schema, name, **props):
         import re
         self.schema = schema
         self.name = name
-        self.props = props
-        if "indexdef" in self.props:
-            self.props["comparison_indexdef"] = re.sub("ON ([^\.]+\.)?", "ON ", self.props["indexdef"])
+        if "indexdef" in props:
+            props["comparison_indexdef"] = re.sub("ON ([^\.]+\.)?", "ON ", props["indexdef"])
+        self.props = Props(props)
 
     def __eq__(self, other):
-        return self.props.get("comparison_indexdef") == other.props.get("comparison_indexdef")
+        return self.fingerprint == other.fingerprint or self.comparison_props == other.comparison_props
+
+    @property
+    def comparison_props(self):
+        # only the definition matters, minus the schema
+        return {"comparison_indexdef": self.props.get("comparison_indexdef")}
 
     def __or__(self, other):
         cs = Changeset()
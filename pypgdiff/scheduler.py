@@ -0,0 +1,79 @@
+from pypgdiff import Changeset
+
+class Scheduler(object):
+    # works out which changes depend on which from what each one creates,
+    # needs, drops and holds (see BaseChange.resources), and groups them into
+    # levels: every change only depends on changes in earlier levels, so the
+    # changes within a level can be applied at the same time
+    def __init__(self, changes):
+        from collections import defaultdict
+        # priorities still decide the order within a level, and between
+        # changes that lock the same table
+        self.changes = Changeset(*changes).ordered()
+        self.requires = [set() for change in self.changes]
+
+        creates, needs, drops, holds = [defaultdict(list) for i in range(4)]
+        locks = defaultdict(list)
+        for index, change in enumerate(self.changes):
+            resources = change.resources()
+            for key, users in (("creates", creates), ("needs", needs), ("drops", drops), ("holds", holds)):
+                for resource in resources.get(key, ()):
+                    users[resource].append(index)
+            for table in resources.get("locks", ()):
+                locks[table].append(index)
+
+        def depend(befores, afters):
+            for before in befores:
+                for after in afters:
+                    if before != after:
+                        self.requires[after].add(before)
+
+        for resource, indexes in creates.items():
+            # things get created before they are used, and after anything of
+            # the same name is dropped
+            depend(indexes, needs.get(resource, ()))
+            depend(drops.get(resource, ()), indexes)
+        for resource, indexes in drops.items():
+            # and only get dropped once nothing is using them
+            depend(holds.get(resource, ()), indexes)
+        for table, indexes in locks.items():
+            # ALTER TABLEs on one table go one at a time, which also keeps two
+            # foreign keys between the same tables from deadlocking each other
+            for before, after in zip(indexes, indexes[1:]):
+                depend([before], [after])
+
+        self.dependents = [[] for change in self.changes]
+        for index, requires in enumerate(self.requires):
+            for before in sorted(requires):
+                self.dependents[before].append(index)
+
+    def dependencies(self, change):
+        # the changes that have to be applied before this one
+        # by identity, changes compare equal to anything with the same priority
+        index = [i for i, c in enumerate(self.changes) if c is change][0]
+        return [self.changes[i] for i in sorted(self.requires[index])]
+
+    def levels(self):
+        # Kahn's algorithm, one level at a time
+        remaining = [len(requires) for requires in self.requires]
+        level = [i for i, count in enumerate(remaining) if not count]
+        levels = []
+        done = 0
+        while level:
+            levels.append([self.changes[i] for i in level])
+            done += len(level)
+            following = []
+            for index in level:
+                for after in self.dependents[index]:
+                    remaining[after] -= 1
+                    if not remaining[after]:
+                        following.append(after)
+            level = sorted(following)
+        if done != len(self.changes):
+            stuck = [self.changes[i].__class__.__name__ for i, count in enumerate(remaining) if count]
+            raise Exception("Circular dependency between changes: %s" % ", ".join(stuck))
+        return levels
+
+def schedule(changes):
+    # the changes grouped into levels that can each be applied in parallel
+    return Scheduler(changes).levels()
@@ -0,0 +1,229 @@
+# Hash trees over a schema: a hash per column, per table (over its columns),
+# per sequence, constraint and index, per kind of object, and for the whole
+# schema.  The same hashes come out of SchemaSummary (from an introspected
+# Schema) and ServerSummary (computed by the server, without transferring
+# any catalog rows), so two schemas anywhere can be compared by swapping a
+# few hashes, descending only into the parts that differ.
+#
+# Every hash is an md5 over text both sides can produce:
+#   leaf - "key=value|key=value..." over the object's comparison props, by key
+#          (NULL as \N, booleans as true/false)
+#   node - "name:hash\n..." over its children, by name (bytewise, COLLATE "C")
+
+from pypgdiff.objects import native, utf8
+
+KINDS = ("constraints", "indexes", "sequences", "tables")
+
+def _text(value):
+    # python 2 byte strings throughout, so non-ASCII text never gets decoded
+    if value is None:
+        return "\\N"
+    if value is True or value is False:
+        return "true" if value else "false"
+    return native(value) if isinstance(value, type(u"")) else "%s" % (value,)
+
+def leaf_hash(props):
+    import hashlib
+    text = "|".join("%s=%s" % (_text(key), _text(props[key])) for key in sorted(props))
+    return hashlib.md5(utf8(text)).hexdigest()
+
+def node_hash(children):
+    # children is {name: hash}
+    import hashlib
+    text = "\n".join("%s:%s" % (_text(name), _text(children[name])) for name in sorted(children))
+    return hashlib.md5(utf8(text)).hexdigest()
+
+def constraint_props(props):
+    # constraints keep nested props, flatten them into something SQL can build
+    ret = {
+        "constraint_name"   : props["constraint_name"],
+        "constraint_type"   : props["constraint_type"],
+        "table_name"        : props["table_name"],
+        "is_deferrable"     : props["is_deferrable"],
+        "initially_deferred": props["initially_deferred"],
+        "columns"           : None,
+        "from"              : None,
+        "to"                : None,
+        "to_table"          : None,
+        "positions"         : None,
+        "clause"            : props.get("clause"),
+    }
+    if "columns" in props:
+        ret["columns"] = ",".join(sorted(props["columns"]))
+    if "from" in props:
+        ret["from"] = ",".join(x["column_name"] for x in props["from"])
+        ret["to"] = ",".join(x["column_name"] for x in props["to"])
+        ret["to_table"] = props["to"][0]["table_name"]
+        # where each referenced column sits in the referenced key
+        ret["positions"] = ",".join("%s" % x["position_in_unique_constraint"] for x in props["from"]
+                                    if x.get("position_in_unique_constraint") is not None)
+    return ret
+
+def compare(a, b):
+    # where two summaries differ: {kind: [names]}, plus {"columns": {table: [names]}}
+    # for the tables on both sides, asking each side for as little as possible
+    ret = {}
+    if a.hash() == b.hash():
+        return ret
+    h1, h2 = a.kind_hashes(), b.kind_hashes()
+    for kind in KINDS:
+        if h1[kind] == h2[kind]:
+            continue
+        o1, o2 = a.object_hashes(kind), b.object_hashes(kind)
+        ret[kind] = sorted(name for name in set(o1) | set(o2) if o1.get(name) != o2.get(name))
+        if kind == "tables":
+            both = [name for name in ret[kind] if name in o1 and name in o2]
+            if both:
+                c1, c2 = a.column_hashes(both), b.column_hashes(both)
+                ret["columns"] = dict(
+                    (table, sorted(name for name in set(c1[table]) | set(c2[table]) if c1[table].get(name) != c2[table].get(name)))
+                    for table in both
+                )
+    return ret
+
+class SchemaSummary(object):
+    # hashes worked out in Python from an introspected schema
+    def __init__(self, schema):
+        self.schema = schema
+
+    def column_hashes(self, tables=None):
+        ret = {}
+        for name, table in self.schema.get_tables().items():
+            if tables is None or name in tables:
+                ret[name] = dict((col.name, leaf_hash(col.comparison_props)) for col in table.get_columns().values())
+        return ret
+
+    def object_hashes(self, kind):
+        if kind == "tables":
+            return dict((name, node_hash(cols)) for name, cols in self.column_hashes().items())
+        if kind == "sequences":
+            return dict((name, leaf_hash(seq.comparison_props)) for name, seq in self.schema.get_sequences().items())
+        if kind == "constraints":
+            return dict((c.props["constraint_name"], leaf_hash(constraint_props(c.props))) for c in self.schema.get_constraints().values())
+        if kind == "indexes":
+            return dict((name, leaf_hash(index.comparison_props)) for name, index in self.schema.get_indexes().items())
+        raise Exception("Unknown kind of object: %s" % kind)
+
+    def kind_hashes(self):
+        return dict((kind, node_hash(self.object_hashes(kind))) for kind in KINDS)
+
+    def hash(self):
+        return node_hash(self.kind_hashes())
+
+class ServerSummary(object):
+    # the same hashes, worked out by the server (10 or later); only the
+    # hashes asked for come back over the wire
+    # what BaseObject.scrub_schema_info drops from information_schema.columns
+    scrubbed = ("table_catalog", "table_schema", "ordinal_position",
+                "domain_catalog", "domain_schema",
+                "udt_catalog", "udt_schema", "dtd_identifier")
+
+    def __init__(self, database, name):
+        self.db = database
+        self.name = name
+
+    @classmethod
+    def leaf_sql(cls, expr):
+        # leaf_hash() of a jsonb expression
+        return ("md5((SELECT COALESCE(string_agg(key || '=' || COALESCE(value #>> '{}', '\\N'), '|' ORDER BY key COLLATE \"C\"), '') " +
+                "FROM jsonb_each(%s)))" % expr)
+
+    @classmethod
+    def node_sql(cls, name, hash):
+        # node_hash() as an aggregate
+        return "md5(COALESCE(string_agg(%s || ':' || %s, E'\\n' ORDER BY %s COLLATE \"C\"), ''))" % (name, hash, name)
+
+    def ctes(self):
+        # one CTE per level, every query below picks what it needs from these
+        return (
+            "WITH " +
+            "tabs AS (" +
+                "SELECT table_name::text AS name FROM information_schema.tables " +
+                "WHERE table_schema = %(schema)s AND table_type = 'BASE TABLE' AND table_name !~ '^pgsql_'), " +
+            "cols AS (" +
+                "SELECT c.table_name::text AS tab, c.column_name::text AS name, " +
+                    self.leaf_sql("to_jsonb(c) - ARRAY[%s]" % ", ".join("'%s'" % x for x in self.scrubbed)) + " AS hash " +
+                "FROM information_schema.columns c JOIN tabs t ON (t.name = c.table_name::text) " +
+                "WHERE c.table_schema = %(schema)s), " +
+            "tables AS (" +
+                "SELECT t.name, " + self.node_sql("c.name", "c.hash") + " AS hash " +
+                "FROM tabs t LEFT JOIN cols c ON (c.tab = t.name) GROUP BY t.name), " +
+            "sequences AS (" +
+                "SELECT sequencename::text AS name, " +
+                    self.leaf_sql("jsonb_build_object(" +
+                        "'start_value', start_value, 'increment_by', increment_by, 'max_value', max_value, " +
+                        "'min_value', min_value, 'cache_value', cache_size, 'is_cycled', cycle)") + " AS hash " +
+                "FROM pg_sequences WHERE schemaname = %(schema)s), " +
+            "constraints AS (" +
+                "SELECT con.conname::text AS name, " +
+                    self.leaf_sql("jsonb_build_object(" +
+                        "'constraint_name', con.conname, " +
+                        "'constraint_type', CASE con.contype WHEN 'p' THEN 'PRIMARY KEY' WHEN 'u' THEN 'UNIQUE' WHEN 'f' THEN 'FOREIGN KEY' ELSE 'CHECK' END, " +
+                        "'table_name', rel.relname, " +
+                        "'is_deferrable', CASE WHEN con.condeferrable THEN 'YES' ELSE 'NO' END, " +
+                        "'initially_deferred', CASE WHEN con.condeferred THEN 'YES' ELSE 'NO' END, " +
+                        "'columns', CASE WHEN con.contype IN ('p', 'u') THEN array_to_string(ARRAY(" +
+                            "SELECT a.attname::text FROM unnest(con.conkey) AS k(attnum) " +
+                            "JOIN pg_attribute a ON (a.attrelid = con.conrelid AND a.attnum = k.attnum) ORDER BY a.attname::text COLLATE \"C\"), ',') END, " +
+                        "'from', CASE WHEN con.contype = 'f' THEN array_to_string(ARRAY(" +
+                            "SELECT a.attname::text FROM unnest(con.conkey) WITH ORDINALITY AS k(attnum, n) " +
+                            "JOIN pg_attribute a ON (a.attrelid = con.conrelid AND a.attnum = k.attnum) ORDER BY k.n), ',') END, " +
+                        "'to', CASE WHEN con.contype = 'f' THEN array_to_string(ARRAY(" +
+                            "SELECT a.attname::text FROM unnest(con.confkey) WITH ORDINALITY AS k(attnum, n) " +
+                            "JOIN pg_attribute a ON (a.attrelid = con.confrelid AND a.attnum = k.attnum) ORDER BY k.n), ',') END, " +
+                        "'to_table', frel.relname, " +
+                        "'positions', CASE WHEN con.contype = 'f' THEN array_to_string(ARRAY(" +
+                            "SELECT (SELECT i.n FROM pg_index ix, unnest(ix.indkey::int2[]) WITH ORDINALITY AS i(attnum, n) " +
+                                "WHERE ix.indexrelid = con.conindid AND i.attnum = k.attnum) " +
+                            "FROM unnest(con.confkey) WITH ORDINALITY AS k(attnum, n) ORDER BY k.n), ',') END, " +
+                        "'clause', CASE WHEN con.contype = 'c' THEN substr(pg_get_constraintdef(con.oid), 7) END)") + " AS hash " +
+                "FROM pg_constraint con " +
+                    "JOIN pg_namespace n ON (n.oid = con.connamespace) " +
+                    "JOIN pg_class rel ON (rel.oid = con.conrelid) " +
+                    "LEFT JOIN pg_class frel ON (frel.oid = con.confrelid) " +
+                "WHERE n.nspname = %(schema)s AND con.contype IN ('p', 'u', 'f', 'c') " +
+                    "AND NOT (con.contype = 'c' AND con.conname ~ '_not_null$')), " +
+            "indexes AS (" +
+                "SELECT indexname::text AS name, " +
+                    self.leaf_sql("jsonb_build_object('comparison_indexdef', regexp_replace(indexdef, 'ON ([^\\.]+\\.)?', 'ON ', 'g'))") + " AS hash " +
+                "FROM pg_indexes WHERE schemaname = %(schema)s " +
+                    "AND indexname !~ '(_pkey|_key)$' AND indexdef !~ '^CREATE UNIQUE'), " +
+            "kinds AS (" +
+                " UNION ALL ".join(
+                    "SELECT '%s'::text AS name, (SELECT %s FROM %s) AS hash" % (kind, self.node_sql("name", "hash"), kind)
+                    for kind in KINDS
+                ) +
+            ") "
+        )
+
+    def query(self, sql, **params):
+        if self.db.server_version < 100000:
+            raise Exception("Server side summaries need PostgreSQL 10 or later")
+        params["schema"] = self.name
+        # % in the CTEs is literal, only the named parameters get substituted
+        self.db.execute(self.ctes().replace("%", "%%").replace("%%(schema)s", "%(schema)s") + sql, params)
+        return self.db.fetchall()
+
+    def column_hashes(self, tables=None):
+        ret = dict((table, {}) for table in (tables or ()))
+        if tables is None:
+            rows = self.query("SELECT t.name AS tab, c.name, c.hash FROM tabs t LEFT JOIN cols c ON (c.tab = t.name)")
+        else:
+            rows = self.query("SELECT tab, name, hash FROM cols WHERE tab = ANY(%(tables)s)", tables=list(tables))
+        for tab, name, hash in rows:
+            ret.setdefault(tab, {})
+            if name is not None:
+                ret[tab][name] = hash
+        return ret
+
+    def object_hashes(self, kind):
+        if kind not in KINDS:
+            raise Exception("Unknown kind of object: %s" % kind)
+        return dict((name, hash) for name, hash in self.query("SELECT name, hash FROM %s" % kind))
+
+    def kind_hashes(self):
+        # one row, this is all a check for "no changes" downloads
+        return self.query("SELECT jsonb_object_agg(name, hash) FROM kinds")[0][0]
+
+    def hash(self):
+        return self.query("SELECT " + self.node_sql("name", "hash") + " FROM kinds")[0][0]
@@ -24,6 +24,18 @@ class PgDiffTestCase(unittest.TestCase):
         assert database, 'Need a database name!'
         return psycopg2.connect(database=database, user=user, password=password, host=host)
 
+    def count_queries(self, db):
+        '''record every query db runs through execute() and stream(), as (sql, args)'''
+        queries = []
+        def counting(method):
+            def wrapper(sql, args=None):
+                queries.append((sql, args))
+                return method(sql, args)
+            return wrapper
+        db.execute = counting(db.execute)
+        db.stream = counting(db.stream)
+        return queries
+
     def _create_database(self, schema_name):
         '''create a random database'''
         # create the database
@@ -94,6 +94,9 @@ class SchemaTableTestCase(PgDiffTestCase):
         self.assertEqual(AlterTable, type(cs[0]))
         self.assertEqual(1, len(cs[0]))
         self.assertEqual(AlterColumn, type(cs[0][0]))
+        # column changes are clauses for the AlterTable, AlterColumn has a list of them
+        self.assertEqual(["ALTER COLUMN bar TYPE integer"], cs[0][0].sql)
+        self.assertEqual("ALTER TABLE %s.foo\n    ALTER COLUMN bar TYPE integer\n;" % self.schema2, cs[0].sql)
 
     def test_same_table(self):
         # table exists in both schemas and they match, no changes
@@ -110,6 +113,63 @@ class SchemaTableTestCase(PgDiffTestCase):
         # should be no changes
         self.assertEqual(0, len(cs))
 
+    def test_bulk_columns(self):
+        # columns for every table in the schema are loaded together
+        from pypgdiff.objects import Database, Schema
+
+        self.db1.cursor().execute("CREATE TABLE %s.foo (bar int, baz text)" % self.schema1)
+        self.db1.cursor().execute("CREATE TABLE %s.qux (quux int)" % self.schema1)
+
+        s1 = Schema(database=Database(conn=self.db1), name=self.schema1)
+        t1 = s1.get_tables()
+
+        self.assertEqual(["bar", "baz"], list(t1["foo"].get_columns().keys()))
+        # qux was loaded alongside foo
+        self.assertEqual(["quux"], list(t1["qux"]._cols.keys()))
+
+    def test_shared_connection(self):
+        # both schemas on one connection are introspected one after the other
+        from pypgdiff.objects import Database, Schema
+        from pypgdiff.changes import AlterTable
+
+        c1 = self.db1.cursor()
+        c1.execute("CREATE SCHEMA %s" % self.schema2)
+        c1.execute("CREATE TABLE %s.foo (bar int, baz int)" % self.schema1)
+        c1.execute("CREATE TABLE %s.foo (bar int)" % self.schema2)
+
+        db = Database(conn=self.db1)
+        cs = Schema(database=db, name=self.schema1) | Schema(database=db, name=self.schema2)
+
+        self.assertEqual(1, len(cs))
+        self.assertEqual(AlterTable, type(cs[0]))
+
+    def test_iter_changes(self):
+        # changes stream out phase by phase, already in priority order
+        import types
+        from pypgdiff.objects import Database, Schema
+        from pypgdiff.changes import DropIndex, DropTable, CreateSequence, CreateTable, AlterTable, CreateConstraint, CreateIndex
+
+        c1 = self.db1.cursor()
+        c1.execute("CREATE SEQUENCE %s.foo_seq" % self.schema1)
+        c1.execute("CREATE TABLE %s.foo (bar int PRIMARY KEY, baz int)" % self.schema1)
+        c1.execute("CREATE TABLE %s.qux (quux int)" % self.schema1)
+        c1.execute("CREATE INDEX foo_baz ON %s.foo (baz)" % self.schema1)
+        c2 = self.db2.cursor()
+        c2.execute("CREATE TABLE %s.foo (bar int)" % self.schema2)
+        c2.execute("CREATE TABLE %s.old (bar int)" % self.schema2)
+        c2.execute("CREATE INDEX old_bar ON %s.old (bar)" % self.schema2)
+
+        s1 = Schema(database=Database(conn=self.db1), name=self.schema1)
+        s2 = Schema(database=Database(conn=self.db2), name=self.schema2)
+
+        changes = s1.iter_changes(s2)
+        self.assertIsInstance(changes, types.GeneratorType)
+        self.assertEqual(
+            [DropIndex, DropTable, CreateSequence, CreateTable, AlterTable, CreateConstraint, CreateIndex],
+            [type(c) for c in changes]
+        )
+        self.assertEqual([type(c) for c in s1.iter_changes(s2)], [type(c) for c in s1 | s2])
+
 class SchemaSequenceTestCase(PgDiffTestCase):
     def test_create_sequence(self):
         # sequence exists in schema 1 but not schema 2, add it
@@ -221,6 +281,62 @@ class SchemaSequenceTestCase(PgDiffTestCase):
         # should be no changes
         self.assertEqual(0, len(cs))
 
+    def test_sequence_props(self):
+        # pg_sequences and the per-sequence UNION ALL used before 10 give the
+        # same props, under the names CreateSequence and AlterSequence read
+        from pypgdiff.objects import Database, Schema
+
+        c1 = self.db1.cursor()
+        c1.execute("CREATE SEQUENCE %s.a_seq START WITH 5 INCREMENT BY 2 MINVALUE 5 MAXVALUE 100 CACHE 3 CYCLE" % self.schema1)
+        c1.execute("CREATE SEQUENCE %s.b_seq" % self.schema1)
+        c1.execute("CREATE SEQUENCE %s.c_seq" % self.schema1)
+        c1.execute("SELECT nextval('%s.c_seq'), nextval('%s.c_seq')" % (self.schema1, self.schema1))
+        expected = dict((name, dict(seq.props.items())) for name, seq in
+                        Schema(database=Database(conn=self.db1), name=self.schema1).get_sequences().items())
+        self.assertEqual(
+            {"sequence_name": "a_seq", "last_value": 5, "start_value": 5, "increment_by": 2,
+             "max_value": 100, "min_value": 5, "cache_value": 3, "is_cycled": True},
+            expected["a_seq"]
+        )
+
+        # a 9.6 server keeps all of that on the sequence itself; tables laid
+        # out the same way stand in for them
+        c2 = self.db2.cursor()
+        for name, last_value, start_value, increment_by, max_value, min_value, cache_value, is_cycled, is_called in (
+            ("a_seq", 5, 5, 2, 100, 5, 3, True, False),
+            ("b_seq", 1, 1, 1, 9223372036854775807, 1, 1, False, False),
+            ("c_seq", 2, 1, 1, 9223372036854775807, 1, 1, False, True),
+        ):
+            c2.execute("CREATE TABLE %s.%s (sequence_name name, last_value bigint, start_value bigint, " % (self.schema2, name) +
+                       "increment_by bigint, max_value bigint, min_value bigint, cache_value bigint, " +
+                       "log_cnt bigint, is_cycled boolean, is_called boolean)")
+            c2.execute("INSERT INTO %s.%s VALUES (%%s, %%s, %%s, %%s, %%s, %%s, %%s, 0, %%s, %%s)" % (self.schema2, name),
+                       (name, last_value, start_value, increment_by, max_value, min_value, cache_value, is_cycled, is_called))
+        c2.execute("CREATE VIEW %s.old_sequences AS " % self.schema2 +
+                   "SELECT table_schema AS sequence_schema, table_name AS sequence_name FROM information_schema.tables " +
+                   "WHERE table_name ~ '_seq$' AND table_type = 'BASE TABLE'")
+        old_sequences = "%s.old_sequences" % self.schema2
+        queries = []
+        class OldDatabase(Database):
+            server_version = 90600
+            def execute(self, sql, args=None):
+                queries.append(sql)
+                return Database.execute(self, sql.replace("information_schema.sequences", old_sequences), args)
+        class SmallBatches(Schema):
+            sequence_batch_size = 2
+
+        s2 = SmallBatches(database=OldDatabase(conn=self.db2), name=self.schema2)
+        self.assertEqual(expected, dict((name, dict(seq.props.items())) for name, seq in s2.get_sequences().items()))
+        # the list of sequences, then a batch of two and a batch of one
+        self.assertEqual(3, len(queries))
+        self.assertEqual([1, 0], [sql.count(" UNION ALL ") for sql in queries[1:]])
+
+        # and reloading some of them keeps the rest
+        del queries[:]
+        s2.load_sequences([s2], names=["c_seq"])
+        self.assertEqual(expected, dict((name, dict(seq.props.items())) for name, seq in s2.get_sequences().items()))
+        self.assertEqual(2, len(queries))
+
 class SchemaConstraintTestCase(PgDiffTestCase):
     def test_create_primary_key_constraint(self):
         # constraint exists in schema 1 but not schema 2, create it
@@ -482,6 +598,44 @@ class SchemaConstraintTestCase(PgDiffTestCase):
             cs = s1 | s2
             self.assertEqual(0, len(cs))
 
+    def test_normalized_constraints_composite_foreign_key(self):
+        # multi-column FOREIGN KEY keeps its columns in key order
+        from pypgdiff import Config
+        from pypgdiff.objects import Database, Schema
+
+        c1 = self.db1.cursor()
+        c1.execute("CREATE TABLE %s.target (a int NOT NULL, b int NOT NULL, PRIMARY KEY (b, a))" % self.schema1)
+        c1.execute("CREATE TABLE %s.source (x int, y int, " % self.schema1 +
+                   "CONSTRAINT fk_one FOREIGN KEY (y, x) REFERENCES %s.target (b, a))" % self.schema1)
+
+        with Config(normalize_constraints=True):
+            s1 = Schema(database=Database(conn=self.db1), name=self.schema1)
+            c = s1.get_constraints()
+
+        self.assertIn("PRIMARY KEY_target_a_b", c)
+        fk = c["FOREIGN KEY_source_x_y__to__a_b"]
+        self.assertEqual(["y", "x"], [x["column_name"] for x in fk.props["from"]])
+        self.assertEqual(["b", "a"], [x["column_name"] for x in fk.props["to"]])
+        self.assertEqual("target", fk.props["to"][0]["table_name"])
+
+    def test_foreign_key_positions(self):
+        # position_in_unique_constraint is where the referenced column sits in
+        # the referenced key, as in information_schema
+        from pypgdiff.objects import Database, Schema
+
+        c1 = self.db1.cursor()
+        c1.execute("CREATE TABLE %s.target (a int NOT NULL, b int NOT NULL, PRIMARY KEY (b, a))" % self.schema1)
+        c1.execute("CREATE TABLE %s.source (x int, y int, " % self.schema1 +
+                   "CONSTRAINT fk_one FOREIGN KEY (x, y) REFERENCES %s.target (a, b))" % self.schema1)
+        c1.execute("SELECT column_name, position_in_unique_constraint FROM information_schema.key_column_usage " +
+                   "WHERE constraint_schema = %s AND constraint_name = 'fk_one' ORDER BY ordinal_position", (self.schema1,))
+        expected = [tuple(row) for row in c1.fetchall()]
+
+        s1 = Schema(database=Database(conn=self.db1), name=self.schema1)
+        fk = s1.get_constraints()["fk_one"]
+        self.assertEqual([("x", 2), ("y", 1)], expected)
+        self.assertEqual(expected, [(x["column_name"], x["position_in_unique_constraint"]) for x in fk.props["from"]])
+
     def test_normalized_constraints_check(self):
         # CHECK constraint with different name in 2 schemas but same thingies
         from pypgdiff import Config
@@ -557,3 +711,144 @@ class SchemaIndexTestCase(PgDiffTestCase):
         self.assertEqual(2, len(cs))
         self.assertEqual(DropIndex, type(cs[0]))
         self.assertEqual(CreateIndex, type(cs[1]))
+
+class SchemaFingerprintTestCase(PgDiffTestCase):
+    def test_fingerprints(self):
+        from pypgdiff.objects import Database, Schema
+
+        for c, schema in ((self.db1.cursor(), self.schema1), (self.db2.cursor(), self.schema2)):
+            c.execute("CREATE SEQUENCE %s.foo_seq" % schema)
+            c.execute("CREATE TABLE %s.foo (bar int CONSTRAINT foo_pkey PRIMARY KEY, baz text)" % schema)
+            c.execute("CREATE INDEX foo_baz ON %s.foo (baz)" % schema)
+        # sequence positions aren't part of the fingerprint
+        self.db2.cursor().execute("SELECT nextval('%s.foo_seq')" % self.schema2)
+
+        s1 = Schema(database=Database(conn=self.db1), name=self.schema1)
+        s2 = Schema(database=Database(conn=self.db2), name=self.schema2)
+
+        self.assertEqual(s1.fingerprint, s2.fingerprint)
+        self.assertEqual(s1.get_tables()["foo"].fingerprint, s2.get_tables()["foo"].fingerprint)
+
+        self.db2.cursor().execute("ALTER TABLE %s.foo ALTER COLUMN baz TYPE varchar(10)" % self.schema2)
+        s2 = Schema(database=Database(conn=self.db2), name=self.schema2)
+        self.assertNotEqual(s1.fingerprint, s2.fingerprint)
+        h1, h2 = s1.fingerprints(), s2.fingerprints()
+        self.assertNotEqual(h1["tables"], h2["tables"])
+        self.assertEqual(h1["indexes"], h2["indexes"])
+        self.assertEqual(h1["constraints"], h2["constraints"])
+
+    def test_fingerprint_equality(self):
+        # equal fingerprints settle equality without a deep comparison
+        from pypgdiff import Config
+        from pypgdiff.objects import Database, Schema, Constraint
+
+        self.db1.cursor().execute("CREATE TABLE %s.foo (bar int CONSTRAINT foo_pkey PRIMARY KEY)" % self.schema1)
+        self.db2.cursor().execute("CREATE TABLE %s.foo (bar int CONSTRAINT other_name PRIMARY KEY)" % self.schema2)
+
+        s1 = Schema(database=Database(conn=self.db1), name=self.schema1)
+        s2 = Schema(database=Database(conn=self.db2), name=self.schema2)
+        col1 = s1.get_tables()["foo"].get_columns()["bar"]
+        col2 = s2.get_tables()["foo"].get_columns()["bar"]
+        self.assertEqual(col1.fingerprint, col2.fingerprint)
+        col1.props = None
+        self.assertTrue(col1 == col2)
+
+        # constraint fingerprints follow the config
+        c1 = Constraint(s1, "foo_pkey", constraint_name="foo_pkey", table_name="foo", constraint_type="PRIMARY KEY", columns=set(["bar"]))
+        c2 = Constraint(s2, "other_name", constraint_name="other_name", table_name="foo", constraint_type="PRIMARY KEY", columns=set(["bar"]))
+        self.assertNotEqual(c1.fingerprint, c2.fingerprint)
+        with Config(normalize_constraints=True):
+            self.assertEqual(c1.fingerprint, c2.fingerprint)
+            self.assertEqual(c1, c2)
+
+    def test_fingerprint_non_ascii(self):
+        from pypgdiff.objects import Database, Schema
+        from pypgdiff.changes import AlterTable
+
+        self.db1.cursor().execute('CREATE TABLE %s."caf\xc3\xa9" (bar int CONSTRAINT "caf\xc3\xa9_pkey" PRIMARY KEY, baz int)' % self.schema1)
+        self.db2.cursor().execute('CREATE TABLE %s."caf\xc3\xa9" (bar int CONSTRAINT "caf\xc3\xa9_pkey" PRIMARY KEY)' % self.schema2)
+
+        s1 = Schema(database=Database(conn=self.db1), name=self.schema1)
+        s2 = Schema(database=Database(conn=self.db2), name=self.schema2)
+        self.assertEqual([AlterTable], [type(c) for c in s1 | s2])
+        self.assertEqual(s1.fingerprints()["constraints"], s2.fingerprints()["constraints"])
+
+class SchemaCompactTestCase(PgDiffTestCase):
+    def test_compact_props(self):
+        from pypgdiff.objects import Database, Schema
+
+        c1 = self.db1.cursor()
+        c1.execute("CREATE TABLE %s.foo (bar int NOT NULL, baz varchar(8))" % self.schema1)
+        c1.execute("CREATE TABLE %s.qux (quux int)" % self.schema1)
+
+        s1 = Schema(database=Database(conn=self.db1), name=self.schema1)
+        bar = s1.get_tables()["foo"].get_columns()["bar"]
+        baz = s1.get_tables()["foo"].get_columns()["baz"]
+        quux = s1.get_tables()["qux"].get_columns()["quux"]
+        self.assertFalse(hasattr(bar, "__dict__"))
+        # field names are shared, so are repeated values
+        self.assertTrue(bar.props._layout is quux.props._layout)
+        self.assertTrue(bar.props["data_type"] is quux.props["data_type"])
+
+        # still reads and writes like a dict
+        self.assertEqual("integer", bar.props["data_type"])
+        self.assertEqual(8, baz.props.get("character_maximum_length"))
+        self.assertEqual(None, baz.props.get("missing"))
+        self.assertEqual(dict(bar.props), bar.props.copy())
+        self.assertEqual(bar.props.copy(), bar.props)
+        bar.props["column_default"] = "42"
+        self.assertEqual("42", bar.props["column_default"])
+        bar.props["extra"] = 1
+        self.assertIn("extra", bar.props)
+        self.assertFalse(bar.props._layout is quux.props._layout)
+        del bar.props["extra"]
+        self.assertTrue(bar.props._layout is quux.props._layout)
+
+class DatabaseStreamTestCase(PgDiffTestCase):
+    def test_stream(self):
+        from pypgdiff.objects import Database
+
+        db = Database(conn=self.db1)
+        db.itersize = 2
+        sql = "SELECT n, 'x' || n AS name FROM generate_series(1, %s) AS n"
+        self.assertEqual([{"n": 1, "name": "x1"}, {"n": 2, "name": "x2"}, {"n": 3, "name": "x3"}], list(db.stream(sql, (3,))))
+        self.assertEqual([], list(db.stream(sql, (0,))))
+        # the regular cursor is untouched
+        db.execute("SELECT 1")
+        self.assertEqual([[1]], db.fetchall())
+
+        # outside of a transaction too
+        self.db1.commit()
+        self.db1.autocommit = True
+        self.assertEqual(5, len(list(db.stream(sql, (5,)))))
+
+class DatabaseBatchTestCase(PgDiffTestCase):
+    def test_batch(self):
+        from pypgdiff.objects import Database
+
+        db = Database(conn=self.db1)
+        queries = self.count_queries(db)
+
+        results = db.batch([
+            ("SELECT n, 'x' || n AS name, n > 1 AS big, ARRAY['a', %s] AS arr FROM generate_series(1, 2) AS n ORDER BY n", ("100%",)),
+            ("SELECT 1 WHERE false", None),
+            ("SELECT NULL::text AS nothing, 9223372036854775807 AS max", None),
+        ])
+        self.assertEqual(1, len(queries))
+        self.assertEqual(3, len(results))
+        self.assertEqual([[1, "x1", False, ["a", "100%"]], [2, "x2", True, ["a", "100%"]]], results[0])
+        # rows read like DictRows
+        row = results[0][1]
+        self.assertEqual("x2", row["name"])
+        self.assertEqual(2, row[0])
+        self.assertEqual({"n": 2, "name": "x2", "big": True, "arr": ["a", "100%"]}, dict(row))
+        n, name, big, arr = row
+        self.assertEqual("x2", name)
+        self.assertTrue(isinstance(name, str))
+        self.assertEqual([], results[1])
+        self.assertEqual({"nothing": None, "max": 9223372036854775807}, dict(results[2][0]))
+        self.assertEqual([], db.batch([]))
+
+        # an explicit order for the aggregated rows
+        results = db.batch([("SELECT n FROM generate_series(1, 5) AS n", None, "q.n DESC")])
+        self.assertEqual([[5], [4], [3], [2], [1]], results[0])
@@ -46,6 +46,53 @@ class ChangesetSortingTestCase(PgDiffTestCase):
             [x for x in sorted(shuffled)]
         )
 
+    def test_ordered_changeset(self):
+        from random import shuffle
+        from pypgdiff.objects import Database, Schema
+        from pypgdiff import Changeset, changes
+
+        s1 = Schema(database=Database(conn=self.db1), name=self.schema1)
+
+        expected = Changeset()
+        for cls in ("DropIndex",
+                    "DropConstraint",
+                    "DropTable",
+                    "DropSequence",
+                    "CreateSequence",
+                    "AlterSequence",
+                    "CreateTable",
+                    "DropColumn",
+                    "AddColumn",
+                    "AlterColumn",
+                    "CreateConstraint",
+                    "CreateIndex"):
+            expected += getattr(changes, cls)(s1, None)
+
+        shuffled = expected[:]
+        shuffle(shuffled)
+        self.assertEqual(
+            [x for x in expected],
+            Changeset(*shuffled).ordered()
+        )
+
+        # changes with the same priority keep the order they were added in
+        same = [changes.CreateTable(s1, None) for i in range(10)]
+        # changes compare by priority alone, so check they're the same objects
+        self.assertEqual([id(c) for c in same], [id(c) for c in Changeset(*same).ordered()])
+
+    def test_ordered_live_changeset(self):
+        # changes within a priority come out in name order
+        from pypgdiff.objects import Database, Schema
+
+        s1 = Schema(database=Database(conn=self.db1), name=self.schema1)
+        s2 = Schema(database=Database(conn=self.db2), name=self.schema2)
+
+        names = ["t%02d" % i for i in range(20)]
+        for name in reversed(names):
+            self.db1.cursor().execute("CREATE TABLE %s.%s (bar int)" % (self.schema1, name))
+
+        self.assertEqual(names, [x.this.name for x in s1 | s2])
+
     def test_sorting_live_changeset(self):
         from pypgdiff.objects import Database, Schema
         from pypgdiff import Changeset, changes
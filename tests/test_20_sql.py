@@ -136,6 +136,41 @@ class SQLTableTestCase(PgDiffTestCase):
             cs[0].sql
         )
 
+    def test_array_types_rendering_offline(self):
+        # array details are collected during introspection, not while rendering
+        from pypgdiff.objects import Database, Schema
+
+        self.db1.cursor().execute("CREATE TABLE %s.foo (" % self.schema1 +
+                                  "char_restricted char(5)[], " +
+                                  "numeric_restricted numeric(3,2)[] " +
+                                  ")")
+        self.db2.cursor().execute("CREATE TABLE %s.foo (" % self.schema2 +
+                                  "char_restricted char(7)[] " +
+                                  ")")
+
+        s1 = Schema(database=Database(conn=self.db1), name=self.schema1)
+        s2 = Schema(database=Database(conn=self.db2), name=self.schema2)
+        s1.get_tables()["foo"].get_columns()
+
+        # only the referenced types were loaded
+        self.assertEqual(
+            set(["_bpchar", "bpchar", "_numeric", "numeric"]),
+            set([info["typname"] for info in s1.get_types().values()])
+        )
+
+        def execute(*args):
+            raise AssertionError("Unexpected query: %s" % (args,))
+        s1.db.execute = execute
+
+        from pypgdiff.changes import CreateTable
+        self.assertEqual(
+            "CREATE TABLE %s.foo (\n" % self.schema2 +
+            "    char_restricted character(5)[],\n" +
+            "    numeric_restricted numeric(3,2)[]\n" +
+            ");",
+            CreateTable(s1.get_tables()["foo"], s2.get_tables()["foo"]).sql
+        )
+
 class SQLSequenceTestCase(PgDiffTestCase):
     def test_create_sequence(self):
         # sequence exists in schema 1 but not schema 2, add it
@@ -613,6 +648,68 @@ class SQLIndexTestCase(PgDiffTestCase):
             cs[1].sql
         )
 
+class SQLOnlineTestCase(PgDiffTestCase):
+    def test_online_index(self):
+        # indexes are built and dropped without blocking writes, outside a transaction
+        from pypgdiff import Config
+        from pypgdiff.objects import Database, Schema
+
+        self.db1.cursor().execute("CREATE TABLE %s.foo (bar int, baz int)" % self.schema1)
+        self.db1.cursor().execute("CREATE INDEX test_index ON %s.foo USING btree (baz)" % self.schema1)
+        self.db2.cursor().execute("CREATE TABLE %s.foo (bar int, baz int)" % self.schema2)
+        self.db2.cursor().execute("CREATE INDEX test_index ON %s.foo USING btree (bar, baz)" % self.schema2)
+
+        s1 = Schema(database=Database(conn=self.db1), name=self.schema1)
+        s2 = Schema(database=Database(conn=self.db2), name=self.schema2)
+
+        with Config(online=True):
+            cs = s1 | s2
+            self.assertEqual(2, len(cs))
+            self.assertEqual(
+                [("DROP INDEX CONCURRENTLY %s.test_index;" % self.schema2, False)],
+                cs[0].statements
+            )
+            self.assertEqual(
+                [("CREATE INDEX CONCURRENTLY test_index ON %s.foo USING btree (baz);" % self.schema2, False)],
+                cs[1].statements
+            )
+
+        # and back to the usual outside online mode
+        self.assertEqual([("DROP INDEX %s.test_index;" % self.schema2, True)], cs[0].statements)
+
+    def test_online_constraints(self):
+        from pypgdiff import Config
+        from pypgdiff.objects import Database, Schema
+
+        c1 = self.db1.cursor()
+        c2 = self.db2.cursor()
+
+        c1.execute("CREATE TABLE %s.target (pk int NOT NULL, CONSTRAINT target_pkey PRIMARY KEY (pk))" % self.schema1)
+        c1.execute("CREATE TABLE %s.source (fk int NOT NULL, " % self.schema1 +
+                   "CONSTRAINT fk_foo FOREIGN KEY (fk) REFERENCES %s.target (pk), " % self.schema1 +
+                   "CONSTRAINT source_check CHECK (fk > 0))")
+        c2.execute("CREATE TABLE %s.target (pk int NOT NULL)" % self.schema2)
+        c2.execute("CREATE TABLE %s.source (fk int NOT NULL)" % self.schema2)
+
+        s1 = Schema(database=Database(conn=self.db1), name=self.schema1)
+        s2 = Schema(database=Database(conn=self.db2), name=self.schema2)
+
+        with Config(online=True):
+            statements = dict((c.this.name, c.statements) for c in s1 | s2)
+
+        self.assertEqual([
+            ("CREATE UNIQUE INDEX CONCURRENTLY target_pkey ON %s.target (pk);" % self.schema2, False),
+            ("ALTER TABLE %s.target\n    ADD CONSTRAINT target_pkey PRIMARY KEY USING INDEX target_pkey;" % self.schema2, True),
+        ], statements["target_pkey"])
+        self.assertEqual([
+            ("ALTER TABLE %s.source\n    ADD CONSTRAINT fk_foo FOREIGN KEY (fk) REFERENCES target(pk) NOT VALID;" % self.schema2, True),
+            ("ALTER TABLE %s.source\n    VALIDATE CONSTRAINT fk_foo;" % self.schema2, True),
+        ], statements["fk_foo"])
+        self.assertEqual([
+            ("ALTER TABLE %s.source\n    ADD CONSTRAINT source_check CHECK ((fk > 0)) NOT VALID;" % self.schema2, True),
+            ("ALTER TABLE %s.source\n    VALIDATE CONSTRAINT source_check;" % self.schema2, True),
+        ], statements["source_check"])
+
 class SQLReservedTestCase(PgDiffTestCase):
     def test_reserved_quoting(self):
         # make sure special words get quoted
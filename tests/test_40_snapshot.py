@@ -0,0 +1,68 @@
+from tests.common import PgDiffTestCase
+
+class SnapshotTestCase(PgDiffTestCase):
+    def setUp(self):
+        import tempfile
+        super(SnapshotTestCase, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+        super(SnapshotTestCase, self).tearDown()
+
+    def _populate(self, cursor, schema):
+        cursor.execute("CREATE SEQUENCE %s.foo_seq INCREMENT BY 5" % schema)
+        cursor.execute("CREATE TABLE %s.target (pk int NOT NULL PRIMARY KEY)" % schema)
+        cursor.execute("CREATE TABLE %s.foo (" % schema +
+                       "id int NOT NULL DEFAULT nextval('%s.foo_seq'), " % schema +
+                       "fk int REFERENCES %s.target (pk), " % schema +
+                       "name varchar(32) CHECK (name <> ''), " +
+                       "tags char(5)[], " +
+                       "UNIQUE (name))")
+        cursor.execute("CREATE INDEX foo_fk_idx ON %s.foo (fk)" % schema)
+
+    def test_snapshot_roundtrip(self):
+        # a schema diffed against its own snapshot has no changes
+        from pypgdiff.objects import Database, Schema
+        import os
+
+        self._populate(self.db1.cursor(), self.schema1)
+
+        s1 = Schema(database=Database(conn=self.db1), name=self.schema1)
+        for path in ("s1.json", "s1.json.gz"):
+            path = os.path.join(self.tmpdir, path)
+            s1.save(path)
+            snap = Schema.load(path)
+
+            self.assertEqual(0, len(snap | s1))
+            self.assertEqual(0, len(s1 | snap))
+            self.assertEqual(0, len(snap | Schema.load(path)))
+
+    def test_snapshot_diff(self):
+        # diffing a snapshot matches diffing the live schema, without any queries
+        from pypgdiff.objects import Database, Schema
+        import os
+
+        self._populate(self.db1.cursor(), self.schema1)
+        self.db2.cursor().execute("CREATE TABLE %s.foo (id int)" % self.schema2)
+
+        path = os.path.join(self.tmpdir, "s1.json")
+        Schema(database=Database(conn=self.db1), name=self.schema1).save(path)
+        snap = Schema.load(path)
+
+        s1 = Schema(database=Database(conn=self.db1), name=self.schema1)
+        s2 = Schema(database=Database(conn=self.db2), name=self.schema2)
+
+        self.assertEqual(
+            sorted([c.sql for c in s1 | s2]),
+            sorted([c.sql for c in snap | s2])
+        )
+
+    def test_snapshot_version(self):
+        # snapshots from other versions are refused
+        from pypgdiff.objects import Database, Schema
+
+        snapshot = Schema(database=Database(conn=self.db1), name=self.schema1).to_snapshot()
+        snapshot["version"] += 1
+        self.assertRaises(Exception, Schema.from_snapshot, snapshot)
@@ -0,0 +1,73 @@
+from tests.common import PgDiffTestCase
+
+class DiskCacheTestCase(PgDiffTestCase):
+    def setUp(self):
+        import tempfile
+        super(DiskCacheTestCase, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+        super(DiskCacheTestCase, self).tearDown()
+
+    def _schema(self):
+        from pypgdiff.objects import Database, Schema
+
+        db = Database(conn=self.db1)
+        queries = self.count_queries(db)
+        return Schema(database=db, name=self.schema1, cache_dir=self.tmpdir), queries
+
+    def test_unchanged_schema(self):
+        # a second run against an unchanged schema only checks the fingerprint and sequences
+        import os
+
+        c1 = self.db1.cursor()
+        c1.execute("CREATE SEQUENCE %s.foo_seq" % self.schema1)
+        c1.execute("CREATE TABLE %s.foo (bar int PRIMARY KEY, baz char(3)[])" % self.schema1)
+        c1.execute("CREATE INDEX foo_baz_idx ON %s.foo (baz)" % self.schema1)
+
+        s1, queries = self._schema()
+        expected = s1.to_snapshot()
+        self.assertEqual(1, len(os.listdir(self.tmpdir)))
+
+        s1, queries = self._schema()
+        self.assertEqual(expected, s1.to_snapshot())
+        self.assertEqual(2, len(queries))
+
+        # sequences are always read live
+        c1.execute("SELECT nextval('%s.foo_seq')" % self.schema1)
+        c1.execute("SELECT nextval('%s.foo_seq')" % self.schema1)
+        s1, queries = self._schema()
+        self.assertEqual(2, s1.get_sequences()["foo_seq"].props["last_value"])
+
+    def test_changed_schema(self):
+        # DDL invalidates the cache
+        c1 = self.db1.cursor()
+        c1.execute("CREATE TABLE %s.foo (bar int)" % self.schema1)
+
+        s1, queries = self._schema()
+        s1.introspect()
+
+        c1.execute("ALTER TABLE %s.foo ALTER COLUMN bar SET DEFAULT 7" % self.schema1)
+
+        s1, queries = self._schema()
+        s1.introspect()
+        self.assertEqual("7", s1.get_tables()["foo"].get_columns()["bar"].props["column_default"])
+        self.assertTrue(len(queries) > 2)
+
+    def test_diff_skips_summary(self):
+        # a diff against a current disk cache doesn't need the server's hashes
+        from pypgdiff.objects import Database, Schema
+
+        self.db1.cursor().execute("CREATE TABLE %s.foo (bar int)" % self.schema1)
+        self.db2.cursor().execute("CREATE TABLE %s.foo (bar bigint)" % self.schema2)
+        s2 = Schema(database=Database(conn=self.db2), name=self.schema2)
+
+        s1, queries = self._schema()
+        self.assertEqual(1, len(s1 | s2))
+
+        s1, queries = self._schema()
+        self.assertEqual(1, len(s1 | s2))
+        # the fingerprint and sequences
+        self.assertEqual(2, len(queries))
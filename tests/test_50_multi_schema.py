@@ -0,0 +1,67 @@
+from tests.common import PgDiffTestCase
+
+class MultiSchemaTestCase(PgDiffTestCase):
+    def test_get_schemas(self):
+        from pypgdiff.objects import Database
+
+        c1 = self.db1.cursor()
+        c1.execute("CREATE SCHEMA tenant_a")
+        c1.execute("CREATE SCHEMA tenant_b")
+
+        db = Database(conn=self.db1)
+        self.assertEqual(["tenant_a", "tenant_b"], db.get_schemas("^tenant_"))
+        self.assertIn(self.schema1, db.get_schemas())
+        self.assertNotIn("information_schema", db.get_schemas())
+
+    def test_diff_schemas(self):
+        # every pair is compared, with one set of bulk queries per side
+        from pypgdiff.objects import Database, Schema, diff_schemas
+        from pypgdiff.changes import AlterTable, CreateTable, CreateSequence
+
+        c1 = self.db1.cursor()
+        c2 = self.db2.cursor()
+        for c in (c1, c2):
+            c.execute("CREATE SCHEMA tenant_a")
+            c.execute("CREATE SCHEMA tenant_b")
+        c1.execute("CREATE TABLE tenant_a.foo (bar int, baz int[])")
+        c2.execute("CREATE TABLE tenant_a.foo (bar int)")
+        c1.execute("CREATE TABLE tenant_b.foo (bar int)")
+        c1.execute("CREATE SEQUENCE tenant_b.foo_seq")
+
+        db1 = Database(conn=self.db1)
+        db2 = Database(conn=self.db2)
+        queries = self.count_queries(db1)
+
+        results = list(diff_schemas(db1, db2, [("tenant_a", "tenant_a"), ("tenant_b", "tenant_b")]))
+
+        self.assertEqual(["tenant_a", "tenant_b"], [a for a, b, cs in results])
+        self.assertEqual([AlterTable], [type(c) for c in results[0][2]])
+        self.assertEqual([CreateSequence, CreateTable], [type(c) for c in results[1][2]])
+
+        # sequences, tables, constraints and indexes in one batch, then
+        # columns, types and arrays
+        self.assertEqual(4, len(queries))
+        # columns are streamed on their own, never part of the batch
+        self.assertNotIn("information_schema.columns", queries[0][0])
+        self.assertIn("information_schema.columns", queries[1][0])
+        # one type catalog per side
+        self.assertTrue(db1.get_types())
+
+    def test_diff_schemas_same_database(self):
+        # schemas in the same database share a single introspection
+        from pypgdiff.objects import Database, diff_schemas
+        from pypgdiff.changes import AlterTable
+
+        c1 = self.db1.cursor()
+        c1.execute("CREATE SCHEMA golden")
+        c1.execute("CREATE SCHEMA tenant_a")
+        c1.execute("CREATE SCHEMA tenant_b")
+        c1.execute("CREATE TABLE golden.foo (bar int, baz int)")
+        c1.execute("CREATE TABLE tenant_a.foo (bar int, baz int)")
+        c1.execute("CREATE TABLE tenant_b.foo (bar int)")
+
+        db = Database(conn=self.db1)
+        results = dict(((a, b), cs) for a, b, cs in diff_schemas(db, db, [("golden", "tenant_a"), ("golden", "tenant_b")]))
+
+        self.assertEqual(0, len(results[("golden", "tenant_a")]))
+        self.assertEqual([AlterTable], [type(c) for c in results[("golden", "tenant_b")]])
@@ -0,0 +1,95 @@
+from tests.common import PgDiffTestCase
+
+class FanoutTestCase(PgDiffTestCase):
+    def test_fanout_diff(self):
+        from pypgdiff.objects import Database, Schema
+        from pypgdiff.fanout import fanout_diff
+
+        c1 = self.db1.cursor()
+        c1.execute("CREATE TABLE %s.foo (bar int, baz int)" % self.schema1)
+        c1.execute("CREATE SEQUENCE %s.foo_seq" % self.schema1)
+
+        c2 = self.db2.cursor()
+        for name in ("tenant_a", "tenant_b", "tenant_c"):
+            c2.execute("CREATE SCHEMA %s" % name)
+            c2.execute("CREATE SEQUENCE %s.foo_seq" % name)
+        c2.execute("CREATE TABLE tenant_a.foo (bar int, baz int)")
+        c2.execute("CREATE TABLE tenant_b.foo (bar int)")
+        # workers use their own connections
+        self.db2.commit()
+
+        golden = Schema(database=Database(conn=self.db1), name=self.schema1)
+        kwargs = self._connection_kwargs(database=self.databases[1]["name"])
+        results = dict((name, (sql, error)) for name, sql, error in fanout_diff(golden, ["tenant_a", "tenant_b", "tenant_c"], kwargs, processes=2))
+
+        self.assertEqual(set(["tenant_a", "tenant_b", "tenant_c"]), set(results.keys()))
+        self.assertEqual(([], None), results["tenant_a"])
+        sql, error = results["tenant_b"]
+        self.assertIsNone(error)
+        self.assertEqual(1, len(sql))
+        self.assertIn("ADD COLUMN baz", sql[0])
+        sql, error = results["tenant_c"]
+        self.assertIsNone(error)
+        self.assertEqual(1, len(sql))
+        self.assertIn("CREATE TABLE", sql[0])
+
+    def test_fanout_diff_from_snapshot(self):
+        # a snapshot can stand in for the golden schema
+        from pypgdiff.objects import Database, Schema
+        from pypgdiff.fanout import fanout_diff
+
+        c1 = self.db1.cursor()
+        c1.execute("CREATE TABLE %s.foo (bar int)" % self.schema1)
+        snapshot = Schema(database=Database(conn=self.db1), name=self.schema1).to_snapshot()
+
+        c2 = self.db2.cursor()
+        c2.execute("CREATE TABLE %s.foo (bar int)" % self.schema2)
+        self.db2.commit()
+
+        kwargs = self._connection_kwargs(database=self.databases[1]["name"])
+        self.assertEqual([(self.schema2, [], None)], list(fanout_diff(snapshot, [self.schema2], kwargs, processes=1)))
+
+    def test_fanout_diff_online(self):
+        # statements that can't run in a transaction block are flagged
+        from pypgdiff.objects import Database, Schema
+        from pypgdiff.fanout import fanout_diff
+
+        c1 = self.db1.cursor()
+        c1.execute("CREATE TABLE %s.foo (bar int)" % self.schema1)
+        c1.execute("CREATE INDEX foo_bar ON %s.foo (bar)" % self.schema1)
+        golden = Schema(database=Database(conn=self.db1), name=self.schema1)
+
+        c2 = self.db2.cursor()
+        c2.execute("CREATE TABLE %s.foo (bar int)" % self.schema2)
+        self.db2.commit()
+
+        kwargs = self._connection_kwargs(database=self.databases[1]["name"])
+        results = list(fanout_diff(golden, [self.schema2], kwargs, processes=1, online=True))
+        self.assertEqual([(self.schema2, [
+            "-- must run outside a transaction block\nCREATE INDEX CONCURRENTLY foo_bar ON %s.foo USING btree (bar);" % self.schema2,
+        ], None)], results)
+
+    def test_worker_connection(self):
+        # workers hold no transaction open between tenants
+        from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+        from pypgdiff.objects import Database, Schema
+        from pypgdiff import fanout
+
+        self.db1.cursor().execute("CREATE TABLE %s.foo (bar int)" % self.schema1)
+        snapshot = Schema(database=Database(conn=self.db1), name=self.schema1).to_snapshot()
+        c2 = self.db2.cursor()
+        c2.execute("CREATE SEQUENCE %s.foo_seq" % self.schema2)
+        self.db2.commit()
+
+        fanout._init_worker(snapshot, self._connection_kwargs(database=self.databases[1]["name"]), {}, {})
+        conn = fanout._worker["db"].conn
+        try:
+            name, sql, error = fanout._diff_tenant(self.schema2)
+            self.assertIsNone(error)
+            self.assertEqual(TRANSACTION_STATUS_IDLE, conn.get_transaction_status())
+            # and a failing tenant leaves nothing behind either
+            name, sql, error = fanout._diff_tenant("no_such_schema")
+            self.assertEqual(TRANSACTION_STATUS_IDLE, conn.get_transaction_status())
+        finally:
+            conn.close()
+            fanout._worker.clear()
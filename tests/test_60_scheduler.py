@@ -0,0 +1,71 @@
+from tests.common import PgDiffTestCase
+
+class SchedulerTestCase(PgDiffTestCase):
+    def level_of(self, levels, cls, name):
+        for i, level in enumerate(levels):
+            for change in level:
+                obj = change.this or change.that
+                if type(change) is cls and obj.name == name:
+                    return i
+        self.fail("%s %s was not scheduled" % (cls.__name__, name))
+
+    def test_schedule(self):
+        from pypgdiff.objects import Database, Schema
+        from pypgdiff.scheduler import Scheduler
+        from pypgdiff.changes import CreateSequence, CreateTable, CreateConstraint, CreateIndex, DropConstraint, DropTable, DropIndex
+
+        c1 = self.db1.cursor()
+        c1.execute("CREATE SEQUENCE %s.foo_seq" % self.schema1)
+        c1.execute("CREATE TABLE %s.foo (id int DEFAULT nextval('%s.foo_seq') CONSTRAINT foo_pkey PRIMARY KEY, bar int)" % (self.schema1, self.schema1))
+        c1.execute("CREATE TABLE %s.qux (foo_id int CONSTRAINT qux_foo_fkey REFERENCES %s.foo (id))" % (self.schema1, self.schema1))
+        c1.execute("CREATE INDEX foo_bar ON %s.foo (bar)" % self.schema1)
+        c1.execute("CREATE INDEX qux_foo ON %s.qux (foo_id)" % self.schema1)
+
+        c2 = self.db2.cursor()
+        c2.execute("CREATE TABLE %s.old (id int CONSTRAINT old_pkey PRIMARY KEY)" % self.schema2)
+        c2.execute("CREATE TABLE %s.old_ref (old_id int CONSTRAINT old_ref_old_fkey REFERENCES %s.old (id))" % (self.schema2, self.schema2))
+        c2.execute("CREATE INDEX old_ref_idx ON %s.old_ref (old_id)" % self.schema2)
+
+        s1 = Schema(database=Database(conn=self.db1), name=self.schema1)
+        s2 = Schema(database=Database(conn=self.db2), name=self.schema2)
+        cs = s1 | s2
+        scheduler = Scheduler(cs)
+        levels = scheduler.levels()
+
+        # every change is scheduled exactly once
+        self.assertEqual(sorted(id(c) for c in cs), sorted(id(c) for level in levels for c in level))
+
+        # drops: foreign keys before the keys and tables they point at
+        self.assertLess(self.level_of(levels, DropConstraint, "old_ref_old_fkey"), self.level_of(levels, DropConstraint, "old_pkey"))
+        self.assertLess(self.level_of(levels, DropConstraint, "old_ref_old_fkey"), self.level_of(levels, DropTable, "old"))
+        self.assertLess(self.level_of(levels, DropIndex, "old_ref_idx"), self.level_of(levels, DropTable, "old_ref"))
+
+        # creates: sequences before the tables using them, keys before foreign keys
+        self.assertLess(self.level_of(levels, CreateSequence, "foo_seq"), self.level_of(levels, CreateTable, "foo"))
+        self.assertLess(self.level_of(levels, CreateConstraint, "foo_pkey"), self.level_of(levels, CreateConstraint, "qux_foo_fkey"))
+        self.assertLess(self.level_of(levels, CreateTable, "qux"), self.level_of(levels, CreateIndex, "qux_foo"))
+
+        # indexes only wait for their own table
+        for change in cs:
+            if type(change) is CreateIndex:
+                self.assertEqual([CreateTable], [type(c) for c in scheduler.dependencies(change)])
+
+    def test_sequence_dropped_after_its_column(self):
+        # priorities alone would drop the sequence before the column using it
+        from pypgdiff.objects import Database, Schema
+        from pypgdiff.scheduler import Scheduler
+        from pypgdiff.changes import AlterTable, DropSequence
+
+        c1 = self.db1.cursor()
+        c1.execute("CREATE TABLE %s.foo (bar int)" % self.schema1)
+        c2 = self.db2.cursor()
+        c2.execute("CREATE SEQUENCE %s.foo_seq" % self.schema2)
+        c2.execute("CREATE TABLE %s.foo (bar int, baz int DEFAULT nextval('%s.foo_seq'))" % (self.schema2, self.schema2))
+
+        s1 = Schema(database=Database(conn=self.db1), name=self.schema1)
+        s2 = Schema(database=Database(conn=self.db2), name=self.schema2)
+        scheduler = Scheduler(s1 | s2)
+        levels = scheduler.levels()
+
+        self.assertEqual([[AlterTable], [DropSequence]], [[type(c) for c in level] for level in levels])
+        self.assertEqual(levels[0], scheduler.dependencies(levels[1][0]))
@@ -0,0 +1,120 @@
+from tests.common import PgDiffTestCase
+
+class ApplyTestCase(PgDiffTestCase):
+    def connect2(self):
+        return self.get_connection(**self._connection_kwargs(database=self.databases[1]["name"]))
+
+    def test_apply_changes(self):
+        from pypgdiff.objects import Database, Schema
+        from pypgdiff.apply import apply_changes, summarize
+
+        c1 = self.db1.cursor()
+        c1.execute("CREATE SEQUENCE %s.foo_seq" % self.schema1)
+        c1.execute("CREATE TABLE %s.foo (id int PRIMARY KEY, bar int)" % self.schema1)
+        c1.execute("CREATE TABLE %s.qux (foo_id int REFERENCES %s.foo (id), quux text)" % (self.schema1, self.schema1))
+        for i in range(6):
+            c1.execute("CREATE INDEX qux_%s ON %s.qux (quux)" % (i, self.schema1))
+        c2 = self.db2.cursor()
+        c2.execute("CREATE TABLE %s.old (id int)" % self.schema2)
+        # the pool uses its own connections
+        self.db2.commit()
+
+        s1 = Schema(database=Database(conn=self.db1), name=self.schema1)
+        s2 = Schema(database=Database(conn=self.db2), name=self.schema2)
+        cs = s1 | s2
+        finished = []
+        results = apply_changes(cs, self.connect2, jobs=4, callback=finished.append)
+
+        self.assertEqual(len(cs), len(results))
+        self.assertEqual(sorted(id(r) for r in results), sorted(id(r) for r in finished))
+        self.assertEqual([], [(r.sql, r.status) for r in results if not r.ok])
+        self.assertIn("%d applied, 0 failed, 0 skipped" % len(cs), summarize(results))
+
+        # the target now matches
+        self.db2.rollback()
+        s2 = Schema(database=Database(conn=self.db2), name=self.schema2)
+        self.assertEqual([], s1 | s2)
+
+    def test_apply_failure_isolation(self):
+        # a failing change takes the changes depending on it down with it, but nothing else
+        from pypgdiff.objects import Database, Schema
+        from pypgdiff.apply import apply_changes, summarize
+        from pypgdiff.changes import CreateConstraint, CreateIndex
+
+        c1 = self.db1.cursor()
+        c1.execute("CREATE TABLE %s.foo (bar int CONSTRAINT foo_bar_key UNIQUE, baz int)" % self.schema1)
+        c1.execute("CREATE TABLE %s.qux (bar int CONSTRAINT qux_bar_fkey REFERENCES %s.foo (bar))" % (self.schema1, self.schema1))
+        c1.execute("CREATE INDEX foo_baz ON %s.foo (baz)" % self.schema1)
+        c2 = self.db2.cursor()
+        c2.execute("CREATE TABLE %s.foo (bar int, baz int)" % self.schema2)
+        c2.execute("CREATE TABLE %s.qux (bar int)" % self.schema2)
+        c2.execute("INSERT INTO %s.foo VALUES (1, 1), (1, 2)" % self.schema2)
+        self.db2.commit()
+
+        s1 = Schema(database=Database(conn=self.db1), name=self.schema1)
+        s2 = Schema(database=Database(conn=self.db2), name=self.schema2)
+        results = dict((r.change.this.name, r) for r in apply_changes(s1 | s2, self.connect2, jobs=2))
+
+        self.assertIsNotNone(results["foo_bar_key"].error)
+        self.assertTrue(results["qux_bar_fkey"].skipped)
+        self.assertIsNone(results["qux_bar_fkey"].seconds)
+        self.assertTrue(results["foo_baz"].ok)
+        self.assertIn("1 applied, 1 failed, 1 skipped", summarize(list(results.values())))
+
+    def test_apply_online(self):
+        # online statements run one at a time, outside of any transaction
+        from pypgdiff import Config
+        from pypgdiff.objects import Database, Schema
+        from pypgdiff.apply import apply_changes
+
+        c1 = self.db1.cursor()
+        c1.execute("CREATE TABLE %s.foo (id int NOT NULL CONSTRAINT foo_pkey PRIMARY KEY, bar int)" % self.schema1)
+        c1.execute("CREATE TABLE %s.qux (foo_id int CONSTRAINT qux_foo_fkey REFERENCES %s.foo (id))" % (self.schema1, self.schema1))
+        c1.execute("CREATE INDEX foo_bar ON %s.foo (bar)" % self.schema1)
+        c2 = self.db2.cursor()
+        c2.execute("CREATE TABLE %s.foo (id int NOT NULL, bar int)" % self.schema2)
+        c2.execute("CREATE TABLE %s.qux (foo_id int)" % self.schema2)
+        c2.execute("CREATE INDEX old_bar ON %s.foo (bar)" % self.schema2)
+        self.db2.commit()
+
+        s1 = Schema(database=Database(conn=self.db1), name=self.schema1)
+        s2 = Schema(database=Database(conn=self.db2), name=self.schema2)
+        with Config(online=True):
+            results = apply_changes(s1 | s2, self.connect2, jobs=2)
+
+        self.assertEqual([], [(r.sql, r.status) for r in results if not r.ok])
+        self.db2.rollback()
+        s2 = Schema(database=Database(conn=self.db2), name=self.schema2)
+        self.assertEqual([], s1 | s2)
+
+    def test_apply_transaction(self):
+        # a change's transactional statements go in or fail together, and each is timed
+        from pypgdiff.changes import BaseChange
+        from pypgdiff.apply import apply_changes, summarize
+
+        class Stub(BaseChange):
+            def __init__(self, statements):
+                BaseChange.__init__(self, None, None)
+                self._statements = statements
+
+            @property
+            def statements(self):
+                return self._statements
+
+        good = Stub([("CREATE TABLE foo (id int)", True), ("CREATE INDEX CONCURRENTLY foo_id ON foo (id)", False)])
+        bad = Stub([("CREATE TABLE bar (id int)", True), ("CREATE TABLE bar (id int)", True)])
+        self.assertEqual([[good.statements[0]], [good.statements[1]]], good.steps)
+        self.assertEqual([bad.statements], bad.steps)
+        # the pool uses its own connections
+        self.db2.commit()
+        results = apply_changes([good, bad], self.connect2, search_path=self.schema2)
+
+        self.assertEqual([], [(r.sql, r.status) for r in results[:1] if not r.ok])
+        self.assertEqual(2, len([t for t in results[0].timings if t is not None]))
+        self.assertIsNotNone(results[1].error)
+        self.assertEqual(2, len([t for t in results[1].timings if t is not None]))
+        self.assertIn("CREATE INDEX CONCURRENTLY foo_id", summarize(results))
+        # bar's first statement was rolled back with the second
+        c2 = self.db2.cursor()
+        c2.execute("SELECT to_regclass(%s), to_regclass(%s)", (self.schema2 + ".foo_id", self.schema2 + ".bar"))
+        self.assertEqual([self.schema2 + ".foo_id", None], list(c2.fetchone()))
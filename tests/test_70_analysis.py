@@ -0,0 +1,103 @@
+from tests.common import PgDiffTestCase
+
+class AnalysisTestCase(PgDiffTestCase):
+    def test_analyze(self):
+        from pypgdiff.objects import Database, Schema
+        from pypgdiff.analysis import analyze, summarize
+        from pypgdiff.changes import AlterTable, CreateIndex, CreateTable, CreateSequence
+
+        c1 = self.db1.cursor()
+        c1.execute("CREATE SEQUENCE %s.baz_seq" % self.schema1)
+        c1.execute("CREATE TABLE %s.foo (bar bigint, baz int DEFAULT nextval('%s.baz_seq'))" % (self.schema1, self.schema1))
+        c1.execute("CREATE INDEX foo_bar ON %s.foo (bar)" % self.schema1)
+        c1.execute("CREATE TABLE %s.qux (quux varchar(16) NOT NULL, extra int DEFAULT 42)" % self.schema1)
+        c1.execute("CREATE TABLE %s.new (id int)" % self.schema1)
+        c2 = self.db2.cursor()
+        c2.execute("CREATE TABLE %s.foo (bar int)" % self.schema2)
+        c2.execute("INSERT INTO %s.foo SELECT generate_series(1, 10000)" % self.schema2)
+        c2.execute("CREATE TABLE %s.qux (quux varchar(8))" % self.schema2)
+        c2.execute("ANALYZE %s.foo" % self.schema2)
+
+        s1 = Schema(database=Database(conn=self.db1), name=self.schema1)
+        db2 = Database(conn=self.db2)
+        s2 = Schema(database=db2, name=self.schema2)
+        cs = s1 | s2
+
+        queries = self.count_queries(db2)
+
+        impacts = dict(((type(i.change), i.table), i) for i in analyze(cs))
+        # every table size came from one query
+        self.assertEqual(1, len(queries))
+
+        # int -> bigint rewrites the table
+        foo = impacts[(AlterTable, "foo")]
+        self.assertEqual("ACCESS EXCLUSIVE", foo.lock)
+        self.assertTrue(foo.rewrite)
+        self.assertEqual(10000, foo.rows)
+        self.assertTrue(foo.size > 0)
+        self.assertTrue(foo.seconds > 0)
+
+        # varchar -> varchar and a constant default are catalog only, but NOT NULL scans
+        qux = impacts[(AlterTable, "qux")]
+        self.assertFalse(qux.rewrite)
+        self.assertTrue(qux.scan)
+        # never analyzed
+        self.assertIsNone(qux.rows)
+
+        index = impacts[(CreateIndex, "foo")]
+        self.assertEqual("SHARE", index.lock)
+        self.assertEqual("index", index.work)
+        self.assertEqual(foo.size, index.size)
+
+        new = impacts[(CreateTable, "new")]
+        self.assertFalse(new.scan)
+        self.assertEqual(0.0, new.seconds)
+
+        self.assertIsNone(impacts[(CreateSequence, None)].lock)
+        self.assertIn("rewrites foo", summarize(list(impacts.values())))
+
+    def test_analyze_online(self):
+        from pypgdiff import Config
+        from pypgdiff.objects import Database, Schema
+        from pypgdiff.analysis import analyze
+
+        self.db1.cursor().execute("CREATE TABLE %s.foo (bar int, baz int)" % self.schema1)
+        self.db1.cursor().execute("CREATE INDEX test_index ON %s.foo USING btree (baz)" % self.schema1)
+        self.db2.cursor().execute("CREATE TABLE %s.foo (bar int, baz int)" % self.schema2)
+
+        s1 = Schema(database=Database(conn=self.db1), name=self.schema1)
+        s2 = Schema(database=Database(conn=self.db2), name=self.schema2)
+
+        with Config(online=True):
+            impacts = analyze(s1 | s2)
+        self.assertEqual(["SHARE UPDATE EXCLUSIVE"], [i.lock for i in impacts])
+
+    def test_analyze_online_constraints(self):
+        # online mode never reports less than the strongest lock of any statement
+        from pypgdiff import Config
+        from pypgdiff.objects import Database, Schema
+        from pypgdiff.analysis import analyze
+
+        c1 = self.db1.cursor()
+        c1.execute("CREATE TABLE %s.target (pk int NOT NULL, CONSTRAINT target_pkey PRIMARY KEY (pk))" % self.schema1)
+        c1.execute("CREATE TABLE %s.source (fk int NOT NULL, " % self.schema1 +
+                   "CONSTRAINT fk_foo FOREIGN KEY (fk) REFERENCES %s.target (pk), " % self.schema1 +
+                   "CONSTRAINT source_check CHECK (fk > 0))")
+        c2 = self.db2.cursor()
+        c2.execute("CREATE TABLE %s.target (pk int NOT NULL)" % self.schema2)
+        c2.execute("CREATE TABLE %s.source (fk int NOT NULL)" % self.schema2)
+
+        s1 = Schema(database=Database(conn=self.db1), name=self.schema1)
+        s2 = Schema(database=Database(conn=self.db2), name=self.schema2)
+
+        with Config(online=True):
+            impacts = dict((i.change.this.name, i) for i in analyze(s1 | s2))
+
+        # ADD CONSTRAINT ... USING INDEX
+        self.assertEqual("ACCESS EXCLUSIVE", impacts["target_pkey"].lock)
+        # ADD CONSTRAINT ... CHECK ... NOT VALID
+        self.assertEqual("ACCESS EXCLUSIVE", impacts["source_check"].lock)
+        # ADD CONSTRAINT ... FOREIGN KEY ... NOT VALID, on both tables
+        self.assertEqual("SHARE ROW EXCLUSIVE", impacts["fk_foo"].lock)
+        self.assertEqual({"target": "SHARE ROW EXCLUSIVE"}, impacts["fk_foo"].others)
+        self.assertIn("SHARE ROW EXCLUSIVE lock on target", str(impacts["fk_foo"]))
@@ -0,0 +1,73 @@
+from tests.common import PgDiffTestCase
+
+class IncrementalTestCase(PgDiffTestCase):
+    def test_incremental(self):
+        from pypgdiff.objects import Database, Schema
+
+        c1 = self.db1.cursor()
+        c1.execute("CREATE SEQUENCE %s.foo_seq" % self.schema1)
+        c1.execute("CREATE TABLE %s.foo (id int CONSTRAINT foo_pkey PRIMARY KEY, bar int)" % self.schema1)
+        c1.execute("CREATE TABLE %s.qux (foo_id int CONSTRAINT qux_foo_fkey REFERENCES %s.foo (id), quux text[])" % (self.schema1, self.schema1))
+        c1.execute("CREATE TABLE %s.other (baz int)" % self.schema1)
+        c1.execute("CREATE INDEX other_baz ON %s.other (baz)" % self.schema1)
+        # markers come from transaction ids, each step has to be its own transaction
+        self.db1.commit()
+
+        snapshot = Schema.incremental(Database(conn=self.db1), name=self.schema1).to_snapshot()
+        self.assertIn("markers", snapshot)
+
+        # nothing changed: a single query
+        db = Database(conn=self.db1)
+        queries = self.count_queries(db)
+        s = Schema.incremental(db, snapshot=snapshot)
+        self.assertEqual(1, len(queries))
+        self.assertEqual([], s | Schema(database=Database(conn=self.db1), name=self.schema1))
+
+        # change foo and the sequence, leave other alone
+        c1.execute("ALTER TABLE %s.foo ALTER COLUMN bar TYPE bigint" % self.schema1)
+        c1.execute("CREATE INDEX foo_bar ON %s.foo (bar)" % self.schema1)
+        c1.execute("SELECT nextval('%s.foo_seq'), nextval('%s.foo_seq')" % (self.schema1, self.schema1))
+        self.db1.commit()
+
+        db = Database(conn=self.db1)
+        queries = self.count_queries(db)
+        s = Schema.incremental(db, snapshot=snapshot)
+        fresh = Schema(database=Database(conn=self.db1), name=self.schema1)
+        self.assertEqual([], s | fresh)
+        self.assertEqual([], fresh | s)
+        self.assertEqual(["foo_bar", "other_baz"], sorted(s.get_indexes().keys()))
+        self.assertEqual(2, s.get_sequences()["foo_seq"].props["last_value"])
+        # foo changed, qux references it, other wasn't read again
+        read = set()
+        for args in queries[1:]:
+            if "information_schema.columns" in args[0]:
+                read.update(args[1][1])
+        self.assertEqual(set(["foo", "qux"]), read)
+
+        # and dropping things
+        c1.execute("DROP TABLE %s.other" % self.schema1)
+        c1.execute("DROP SEQUENCE %s.foo_seq" % self.schema1)
+        self.db1.commit()
+        s = Schema.incremental(Database(conn=self.db1), snapshot=s.to_snapshot())
+        self.assertEqual(["foo", "qux"], sorted(s.get_tables().keys()))
+        self.assertEqual({}, s.get_sequences())
+        self.assertEqual([], s | Schema(database=Database(conn=self.db1), name=self.schema1))
+
+    def test_refresh_old_server(self):
+        # before 10, nothing in the catalog tells a sequence changed
+        from pypgdiff.objects import Database, Schema
+
+        c1 = self.db1.cursor()
+        c1.execute("CREATE SEQUENCE %s.foo_seq" % self.schema1)
+        c1.execute("CREATE TABLE %s.foo (bar int)" % self.schema1)
+        self.db1.commit()
+
+        s = Schema.incremental(Database(conn=self.db1), name=self.schema1)
+        class OldDatabase(Database):
+            server_version = 90600
+        s.db = OldDatabase(conn=self.db1)
+        reloaded = []
+        s.load_sequences = lambda schemas, names=None: reloaded.append(names)
+        s._markers = s.get_markers()
+        s.refresh()
+        self.assertEqual([["foo_seq"]], reloaded)
@@ -0,0 +1,117 @@
+from tests.common import PgDiffTestCase
+
+class SummaryTestCase(PgDiffTestCase):
+    def create(self, conn, schema):
+        c = conn.cursor()
+        c.execute("CREATE SEQUENCE %s.foo_seq INCREMENT BY 2 CYCLE" % schema)
+        c.execute("CREATE TABLE %s.foo (id int CONSTRAINT foo_pkey PRIMARY KEY, bar varchar(16) NOT NULL DEFAULT 'x', " % schema +
+                  "baz numeric(10, 2), tags text[], CONSTRAINT foo_bar_baz_key UNIQUE (baz, bar))")
+        c.execute("CREATE TABLE %s.qux (foo_id int CONSTRAINT qux_foo_fkey REFERENCES %s.foo (id) DEFERRABLE, " % (schema, schema) +
+                  "n int CONSTRAINT qux_n_check CHECK (n > 0), " +
+                  "label text DEFAULT 'caf\xc3\xa9' CONSTRAINT qux_label_check CHECK (label <> 'na\xc3\xafve'))")
+        c.execute('CREATE TABLE %s."caf\xc3\xa9" ("cr\xc3\xa8me" int)' % schema)
+        c.execute("CREATE INDEX qux_n ON %s.qux (n) WHERE n > 10" % schema)
+        c.execute("CREATE TABLE %s.empty ()" % schema)
+
+    def test_python_matches_server(self):
+        from pypgdiff.objects import Database, Schema
+        from pypgdiff.summary import KINDS, SchemaSummary, ServerSummary
+
+        self.create(self.db1, self.schema1)
+        db = Database(conn=self.db1)
+        local = SchemaSummary(Schema(database=db, name=self.schema1))
+        remote = ServerSummary(db, self.schema1)
+
+        self.assertEqual(local.column_hashes(), remote.column_hashes())
+        self.assertEqual(["bar", "baz", "id", "tags"], sorted(remote.column_hashes(["foo"])["foo"].keys()))
+        self.assertEqual({"empty": {}}, remote.column_hashes(["empty"]))
+        for kind in KINDS:
+            self.assertEqual(local.object_hashes(kind), remote.object_hashes(kind))
+        self.assertEqual(["foo_bar_baz_key", "foo_pkey", "qux_foo_fkey", "qux_label_check", "qux_n_check"], sorted(remote.object_hashes("constraints").keys()))
+        self.assertEqual(local.kind_hashes(), remote.kind_hashes())
+        self.assertEqual(local.hash(), remote.hash())
+
+    def test_compare(self):
+        from pypgdiff.objects import Database, Schema
+        from pypgdiff.summary import SchemaSummary, ServerSummary, compare
+
+        self.create(self.db1, self.schema1)
+        self.create(self.db2, self.schema2)
+        db1, db2 = Database(conn=self.db1), Database(conn=self.db2)
+
+        # identical schemas, one query each
+        queries = self.count_queries(db2)
+        self.assertEqual({}, compare(ServerSummary(db1, self.schema1), ServerSummary(db2, self.schema2)))
+        self.assertEqual(1, len(queries))
+
+        c2 = self.db2.cursor()
+        c2.execute("ALTER TABLE %s.foo ALTER COLUMN baz TYPE numeric(12, 2)" % self.schema2)
+        c2.execute("ALTER SEQUENCE %s.foo_seq INCREMENT BY 3" % self.schema2)
+        c2.execute("CREATE TABLE %s.other (id int)" % self.schema2)
+        # moving a sequence along doesn't count
+        c2.execute("SELECT nextval('%s.foo_seq')" % self.schema2)
+
+        expected = {
+            "tables"   : ["foo", "other"],
+            "sequences": ["foo_seq"],
+            "columns"  : {"foo": ["baz"]},
+        }
+        del queries[:]
+        self.assertEqual(expected, compare(ServerSummary(db1, self.schema1), ServerSummary(db2, self.schema2)))
+        # schema, kinds, tables, sequences, then the columns of foo
+        self.assertEqual(5, len(queries))
+        # and either side can be worked out locally
+        self.assertEqual(expected, compare(SchemaSummary(Schema(database=db1, name=self.schema1)), ServerSummary(db2, self.schema2)))
+
+    def test_server_fingerprints(self):
+        from pypgdiff.objects import Database, Schema
+        from pypgdiff.changes import AlterSequence
+
+        self.create(self.db1, self.schema1)
+        self.create(self.db2, self.schema2)
+        self.db1.cursor().execute("SELECT nextval('%s.foo_seq'), nextval('%s.foo_seq')" % (self.schema1, self.schema1))
+        db2 = Database(conn=self.db2)
+        queries = self.count_queries(db2)
+
+        # same tables, constraints and indexes: only sequences get loaded
+        s1 = Schema(database=Database(conn=self.db1), name=self.schema1)
+        s2 = Schema(database=db2, name=self.schema2)
+        cs = s1 | s2
+        self.assertEqual([AlterSequence], [c.__class__ for c in cs])
+        self.assertEqual(2, len(queries))
+        self.assertFalse(hasattr(s2, "_tables"))
+
+        # anything else differs: the full comparison runs
+        self.db2.cursor().execute("ALTER TABLE %s.qux ADD COLUMN extra int" % self.schema2)
+        s2 = Schema(database=db2, name=self.schema2)
+        cs = Schema(database=Database(conn=self.db1), name=self.schema1) | s2
+        self.assertEqual(["AlterSequence", "AlterTable"], sorted(c.__class__.__name__ for c in cs))
+        self.assertTrue(hasattr(s2, "_tables"))
+
+        # a snapshot can't answer, so the live side isn't asked either
+        snapshot = Schema.from_snapshot(Schema(database=Database(conn=self.db1), name=self.schema1).to_snapshot())
+        del queries[:]
+        cs = snapshot | Schema(database=db2, name=self.schema2)
+        self.assertEqual(["AlterSequence", "AlterTable"], sorted(c.__class__.__name__ for c in cs))
+        self.assertEqual([], [sql for sql, args in queries if "jsonb_object_agg" in sql])
+
+    def test_foreign_key_positions(self):
+        # the same columns, referencing a key in a different column order
+        from pypgdiff.objects import Database, Schema
+        from pypgdiff.summary import SchemaSummary, ServerSummary
+
+        for conn, schema, key in ((self.db1, self.schema1, "a, b"), (self.db2, self.schema2, "b, a")):
+            c = conn.cursor()
+            c.execute("CREATE TABLE %s.target (a int NOT NULL, b int NOT NULL, PRIMARY KEY (%s))" % (schema, key))
+            c.execute("CREATE TABLE %s.source (x int, y int, " % schema +
+                      "CONSTRAINT source_fkey FOREIGN KEY (x, y) REFERENCES %s.target (a, b))" % schema)
+
+        db1, db2 = Database(conn=self.db1), Database(conn=self.db2)
+        for db, schema in ((db1, self.schema1), (db2, self.schema2)):
+            self.assertEqual(SchemaSummary(Schema(database=db, name=schema)).object_hashes("constraints"),
+                             ServerSummary(db, schema).object_hashes("constraints"))
+        self.assertNotEqual(ServerSummary(db1, self.schema1).kind_hashes()["constraints"],
+                            ServerSummary(db2, self.schema2).kind_hashes()["constraints"])
+        # so the server side shortcut agrees with the full comparison
+        cs = Schema(database=db1, name=self.schema1) | Schema(database=db2, name=self.schema2)
+        self.assertEqual(["DropConstraint", "CreateConstraint"], [c.__class__.__name__ for c in cs])
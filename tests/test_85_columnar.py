@@ -0,0 +1,42 @@
+from tests.common import PgDiffTestCase
+
+class ColumnarTestCase(PgDiffTestCase):
+    def setUp(self):
+        super(ColumnarTestCase, self).setUp()
+        c1 = self.db1.cursor()
+        c1.execute("CREATE TABLE %s.foo (id int, bar varchar(16) NOT NULL DEFAULT 'x', added int)" % self.schema1)
+        c1.execute("CREATE TABLE %s.same (id int, baz numeric(10, 2))" % self.schema1)
+        c1.execute("CREATE TABLE %s.new (id int)" % self.schema1)
+        c2 = self.db2.cursor()
+        c2.execute("CREATE TABLE %s.foo (id int, bar varchar(8), dropped text)" % self.schema2)
+        c2.execute("CREATE TABLE %s.same (id int, baz numeric(10, 2))" % self.schema2)
+        c2.execute("CREATE TABLE %s.old (id int)" % self.schema2)
+
+    def test_diff(self):
+        from pypgdiff.objects import Database, Schema
+        from pypgdiff.columnar import ColumnStore
+
+        s1 = Schema(database=Database(conn=self.db1), name=self.schema1)
+        s2 = Schema(database=Database(conn=self.db2), name=self.schema2)
+        expected = {"foo": {"bar": "alter", "added": "add", "dropped": "drop"}}
+        for use_numpy in (True, False):
+            store1 = ColumnStore(s1.get_tables(), use_numpy=use_numpy)
+            store2 = ColumnStore(s2.get_tables(), use_numpy=use_numpy)
+            self.assertEqual(["foo", "new", "same"], store1.tables)
+            self.assertEqual(6, len(store1))
+            self.assertEqual(expected, store1.diff(store2))
+            self.assertEqual({}, store1.diff(store1))
+
+    def test_changes(self):
+        from pypgdiff import Config
+        from pypgdiff.objects import Database, Schema
+
+        def changes(**conf):
+            s1 = Schema(database=Database(conn=self.db1), name=self.schema1)
+            s2 = Schema(database=Database(conn=self.db2), name=self.schema2)
+            with Config(**conf):
+                return [c.sql for c in s1 | s2]
+
+        cs = changes(columnar=True)
+        self.assertEqual(changes(), cs)
+        self.assertEqual(3, len(cs))
@@ -0,0 +1,56 @@
+from tests.common import PgDiffTestCase
+
+class AsyncDatabaseTestCase(PgDiffTestCase):
+    def setUp(self):
+        super(AsyncDatabaseTestCase, self).setUp()
+        c1 = self.db1.cursor()
+        c1.execute("CREATE SEQUENCE %s.foo_seq" % self.schema1)
+        c1.execute("CREATE TABLE %s.foo (id int CONSTRAINT foo_pkey PRIMARY KEY, tags text[])" % self.schema1)
+        c1.execute("CREATE TABLE %s.bar (foo_id int CONSTRAINT bar_foo_fkey REFERENCES %s.foo (id))" % (self.schema1, self.schema1))
+        c1.execute("CREATE INDEX bar_foo_id ON %s.bar (foo_id)" % self.schema1)
+        # the asynchronous connections can only see what's committed
+        self.db1.commit()
+
+    def connect_kwargs(self):
+        return self._connection_kwargs(database=self.databases[0]["name"])
+
+    def test_blocking(self):
+        # the regular Schema API on top of the asynchronous backend
+        from pypgdiff.aio import AsyncDatabase
+        from pypgdiff.objects import BaseDatabase, Database, Schema
+
+        db = AsyncDatabase(**self.connect_kwargs())
+        try:
+            self.assertTrue(isinstance(db, BaseDatabase))
+            # batches fall back to one query after another
+            self.assertEqual([[[1]], [[2]]], [[list(row) for row in rows] for rows in db.batch([("SELECT 1", None), ("SELECT %s", (2,))])])
+            s1 = Schema(database=db, name=self.schema1)
+            self.assertEqual(["bar", "foo"], sorted(s1.get_tables().keys()))
+            self.assertEqual(["bar_foo_fkey", "foo_pkey"], sorted(s1.get_constraints().keys()))
+            s2 = Schema(database=Database(conn=self.db2), name=self.schema2)
+            self.assertEqual(["CreateSequence", "CreateTable", "CreateTable", "CreateConstraint", "CreateConstraint", "CreateIndex"],
+                             [c.__class__.__name__ for c in s1 | s2])
+        finally:
+            db.close()
+
+    def test_introspect(self):
+        from pypgdiff.aio import AsyncDatabase, get_asyncio
+        try:
+            asyncio = get_asyncio()
+        except ImportError:
+            self.skipTest("neither asyncio nor trollius is available")
+        from pypgdiff.objects import Database, Schema
+
+        db = AsyncDatabase(connections=3, **self.connect_kwargs())
+        try:
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            s1, = loop.run_until_complete(db.introspect(self.schema1))
+            loop.close()
+            self.assertTrue(s1.db is db)
+            expected = Schema(database=Database(conn=self.db1), name=self.schema1)
+            self.assertEqual([], s1 | expected)
+            self.assertEqual(["foo_seq"], list(s1._sequences.keys()))
+            self.assertEqual(["bar_foo_id"], list(s1._indexes.keys()))
+        finally:
+            db.close()